@@ -0,0 +1,76 @@
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import math
+import time
+import numpy as np
+import pygame
+from src.SandStorm import SandStorm
+from src.HeightMap import HeightMap
+
+"""
+Headless sand storm simulation.
+It runs the storm physics and terrain emission without a display or an
+OpenGL context. Time is simulated with a fixed step, so the results do not
+depend on the speed of the machine. It is used for long batch simulations
+and benchmarks on machines without a display.
+
+Usage: python headless.py --steps 3600 --particles 10000
+       python headless.py --steps 600 --record storm.rec
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the sand storm simulation without a display")
+    parser.add_argument("--steps", type=int, default=3600, help="number of simulation steps")
+    parser.add_argument("--dt", type=float, default=1 / 60, help="simulated seconds per step")
+    parser.add_argument("--particles", type=int, default=1000, help="maximum number of particles")
+    parser.add_argument("--wind-direction", type=float, default=0.0, help="wind direction in degrees")
+    parser.add_argument("--wind-strength", type=float, default=5.0, help="wind strength")
+    parser.add_argument("--mass", type=float, default=0.5, help="particle mass")
+    parser.add_argument("--lifetime", type=float, default=1.0, help="particle lifetime")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the simulation, runs with the same seed give the same results")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes for the particle simulation (0 runs it in this process)")
+    parser.add_argument("--record", default=None, help="record the particles of every step to this file, replay it with main.py --replay")
+    parser.add_argument("--report-every", type=int, default=0, help="print progress every N steps (0 disables)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    height_map = HeightMap()
+    sand_storm = SandStorm(pygame.Vector3(0, 14, 0), num_particles=0, max_particles=args.particles,
+                           workers=args.workers, seed=args.seed)
+
+    # Same parameter mapping as the sliders in main.py
+    angle = math.radians(args.wind_direction)
+    sand_storm.set_wind(pygame.Vector3(math.cos(angle), 0, math.sin(angle)) * args.wind_strength)
+    sand_storm.set_parameters(
+        wind_strength=args.wind_strength,
+        particle_mass=args.mass,
+        particle_lifetime=args.lifetime,
+    )
+    if args.record:
+        sand_storm.start_recording(args.record)
+
+    start = time.perf_counter()
+    for step in range(1, args.steps + 1):
+        sand_storm.update(args.dt, height_map)
+        if args.report_every and step % args.report_every == 0:
+            clusters = len(np.unique(sand_storm.clusters()))
+            print(f"step {step}: {len(sand_storm.particles)} particles in {clusters} clusters")
+    elapsed = time.perf_counter() - start
+    sand_storm.close()
+
+    simulated = args.steps * args.dt
+    print(f"Simulated {simulated:.2f} s in {args.steps} steps, {elapsed:.3f} s wall time")
+    print(f"{elapsed / max(args.steps, 1) * 1000:.3f} ms per step, {len(sand_storm.particles)} particles at the end")
+    print(f"Seed {sand_storm.random.seed}")
+    if args.record:
+        print(f"Recorded {args.steps} frames to {args.record}, {os.path.getsize(args.record) / 1e6:.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
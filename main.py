@@ -1,4 +1,7 @@
+import argparse
 import math
+import time
+import numpy as np
 import pygame
 from pygame.locals import *
 from OpenGL.GL import *
@@ -7,10 +10,19 @@ from src.Camera import *
 from src.consts import *
 from src.SandStorm import SandStorm
 from src.Ground import Ground
-from src.Terrain import Terrain
+from src.HeightMap import HeightMap
+from src.ChunkedTerrain import ChunkedTerrain
 from src.Sky import Sky
 from src.Slider import Slider, draw_text
-import random
+from src.Profiler import FrameProfiler
+from src.Parameters import Parameters
+from src.TextRenderer import get_glyph_atlas, draw_quads, quad
+from src.RenderTarget import RenderTarget
+from src.Frustum import Frustum
+from src.Recording import FramePlayer
+from src.SceneUniforms import SceneUniforms
+from src.QualityController import QualityController
+from src.FixedTimestep import FixedTimestep
 
 
 
@@ -23,6 +35,25 @@ PANEL_PADDING = 20
 SLIDER_WIDTH = 200
 SLIDER_HEIGHT = 20
 
+# Frame timing overlay, drawn next to the control panel
+PROFILED_STAGES = ("events", "camera", "storm update", "storm draw", "sky", "ground", "terrain", "panel", "swap")
+OVERLAY_X = PANEL_WIDTH + 10
+OVERLAY_Y = 10
+OVERLAY_FONT_SIZE = 18
+OVERLAY_COLUMNS = (0, 110, 170)  # Stage name, average and 99th percentile
+
+# Frames skipped by the arrow keys in replay mode
+REPLAY_SEEK_FRAMES = 60
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sand storm simulation")
+    parser.add_argument("--record", default=None, help="record the particles of every frame to this file")
+    parser.add_argument("--replay", default=None, help="play a recording instead of simulating, arrow keys seek")
+    parser.add_argument("--fixed-quality", action="store_true", help="never lower the particle count or detail under load")
+    return parser.parse_args()
+
+args = parse_args()
+
 # Calculate dynamic spacing based on screen height
 def calculate_spacing():
     screen_height = math.fabs(window_dimensions[3] - window_dimensions[2])
@@ -51,6 +82,9 @@ particle_lifetime_slider = Slider(PANEL_PADDING, START_Y + GROUP_SPACING + SLIDE
 
 sky_b_slider = Slider(PANEL_PADDING, START_Y + GROUP_SPACING * 2 + SLIDER_SPACING * 1, SLIDER_WIDTH, SLIDER_HEIGHT, 0, 255, 0, is_sky_rgb=True)  # 0.4 * 255
 
+sliders = [wind_slider, wind_strength_slider, particle_count_slider, particle_mass_slider,
+           particle_lifetime_slider, sky_b_slider]
+
 def draw_control_panel():
     # Disable lighting for UI elements
     glDisable(GL_LIGHTING)
@@ -110,12 +144,140 @@ def draw_control_panel():
     draw_text("Space - Up", PANEL_PADDING + 100, 730, font_size=18)
     draw_text("Esc - Exit", PANEL_PADDING + 100, 750, font_size=18)
     draw_text("Tab - Show/hide cursor", PANEL_PADDING, 600, font_size=20)
+    draw_text("F3 - Timings", PANEL_PADDING, 750, font_size=18)
+    draw_text("F4 - Save trace", PANEL_PADDING, 770, font_size=18)
 
     
     # Re-enable lighting and depth testing
     glEnable(GL_LIGHTING)
     glEnable(GL_DEPTH_TEST)
 
+def panel_state():
+    """Everything the look of the control panel depends on"""
+    return (screen.get_width(), screen.get_height()) + tuple(slider.state() for slider in sliders)
+
+def draw_cached_control_panel():
+    """
+    Draw the control panel from its texture. The panel is drawn again into
+    the texture only when a slider or the window size has changed.
+    """
+    global panel_key, panel_vertices
+    state = panel_state()
+    if state != panel_key:
+        panel_key = state
+        panel_target.resize(PANEL_WIDTH, screen_height)
+        panel_vertices = np.array(quad(0, 0, panel_target.width, panel_target.height), dtype=np.float32)
+        panel_target.begin()
+        # The panel is opaque, keep the alpha at 1 where the text is blended in
+        panel_target.clear((0.0, 0.0, 0.0, 1.0))
+        glColorMask(GL_TRUE, GL_TRUE, GL_TRUE, GL_FALSE)
+        glMatrixMode(GL_PROJECTION)
+        glPushMatrix()
+        glLoadIdentity()
+        gluOrtho2D(0, panel_target.width, panel_target.height, 0)
+        glMatrixMode(GL_MODELVIEW)
+        draw_control_panel()
+        glMatrixMode(GL_PROJECTION)
+        glPopMatrix()
+        glMatrixMode(GL_MODELVIEW)
+        glColorMask(GL_TRUE, GL_TRUE, GL_TRUE, GL_TRUE)
+        panel_target.end()
+
+    # Row 0 of the texture is the bottom of the panel
+    glDisable(GL_LIGHTING)
+    glDisable(GL_DEPTH_TEST)
+    draw_quads(panel_target.texture, panel_vertices, panel_tex_coords)
+    glEnable(GL_LIGHTING)
+    glEnable(GL_DEPTH_TEST)
+
+def update_profiler_overlay():
+    """
+    Lay out the timing table again, only every PROFILER_OVERLAY_REFRESH frames
+    """
+    global overlay_quads, overlay_height
+    atlas = get_glyph_atlas(OVERLAY_FONT_SIZE)
+    rows = [("stage", "avg ms", "p99 ms")]
+    rows += [(name, f"{average:.2f}", f"{p99:.2f}") for name, (average, p99) in profiler.statistics().items()]
+    if quality is not None:
+        rows += [("quality", "", "")] + [(name, f"{scale:.0%}", "") for name, scale in quality.scales.items()]
+
+    vertices = []
+    tex_coords = []
+    for line, row in enumerate(rows):
+        y = OVERLAY_Y + 5 + atlas.height * (line + 1)
+        for column, text in zip(OVERLAY_COLUMNS, row):
+            quads = atlas.layout(text, OVERLAY_X + 5 + column, y)
+            vertices.append(quads[0])
+            tex_coords.append(quads[1])
+    overlay_quads = (np.concatenate(vertices), np.concatenate(tex_coords))
+    overlay_height = atlas.height * len(rows) + 10
+
+def draw_profiler_overlay():
+    if profiler.frame_count % PROFILER_OVERLAY_REFRESH == 0 or overlay_quads is None:
+        update_profiler_overlay()
+
+    glDisable(GL_LIGHTING)
+    glDisable(GL_DEPTH_TEST)
+    glColor3f(1.0, 0.95, 0.9)
+    glBegin(GL_QUADS)
+    glVertex2f(OVERLAY_X, OVERLAY_Y)
+    glVertex2f(OVERLAY_X + OVERLAY_COLUMNS[-1] + 70, OVERLAY_Y)
+    glVertex2f(OVERLAY_X + OVERLAY_COLUMNS[-1] + 70, OVERLAY_Y + overlay_height)
+    glVertex2f(OVERLAY_X, OVERLAY_Y + overlay_height)
+    glEnd()
+    get_glyph_atlas(OVERLAY_FONT_SIZE).draw(*overlay_quads)
+    glEnable(GL_LIGHTING)
+    glEnable(GL_DEPTH_TEST)
+
+def export_trace():
+    path = time.strftime("frame_trace_%Y%m%d_%H%M%S.json")
+    profiler.export(path)
+    print(f"Saved the last {min(profiler.frame_count, profiler.capacity)} frames to {path}")
+
+def read_sliders():
+    """Copy the slider values into the parameters, unchanged values are ignored"""
+    parameters.update(
+        wind_direction=wind_slider.value,
+        wind_strength=wind_strength_slider.value,
+        particle_count=int(particle_count_slider.value),
+        particle_mass=particle_mass_slider.value,
+        particle_lifetime=particle_lifetime_slider.value,
+        sky_blue=sky_b_slider.value,
+    )
+
+def apply_parameter_changes(changes):
+    """
+    Update the storm and the sky with the parameters changed in this frame
+    """
+    if "wind_direction" in changes or "wind_strength" in changes:
+        angle = math.radians(parameters["wind_direction"])
+        wind_direction = pygame.Vector3(math.cos(angle), 0, math.sin(angle)) * parameters["wind_strength"]
+        sand_storm.set_wind(wind_direction)
+    if "particle_count" in changes:
+        sand_storm.set_max_particles(particle_cap())
+
+    storm_changes = {name: changes[name] for name in ("wind_strength", "particle_mass", "particle_lifetime")
+                     if name in changes}
+    if storm_changes:
+        sand_storm.set_parameters(**storm_changes)
+
+    if "sky_blue" in changes:
+        sky.update_colors(changes["sky_blue"])
+
+def particle_cap():
+    """Particle count of the slider, scaled down by the quality controller under load"""
+    scale = quality.scales["particles"] if quality is not None else 1.0
+    return round(parameters["particle_count"] * scale)
+
+def apply_quality_changes(changes):
+    """
+    Update the storm with the scales changed by the quality controller
+    """
+    if "particles" in changes:
+        sand_storm.set_max_particles(particle_cap())
+    sand_storm.set_quality(emission_scale=changes.get("emission"), lod_scale=changes.get("lod"))
+    print(quality.describe(changes))
+
 def set_2d():
     glMatrixMode(GL_PROJECTION)
     glLoadIdentity()
@@ -125,28 +287,11 @@ def set_2d():
     glViewport(0, 0, screen.get_width(), screen.get_height())
 
 def set_3d():
-    glMatrixMode(GL_PROJECTION)
-    glLoadMatrixf(camera.get_PPM())
-    glMatrixMode(GL_MODELVIEW)
-    glLoadMatrixf(camera.get_VM())
-    glViewport(0, 0, screen.get_width(), screen.get_height())
-    
-    # Enable depth testing and lighting
+    viewport = (0, 0, screen.get_width(), screen.get_height())
+    glViewport(*viewport)
+    # Camera and light for the shaders, uploaded only when they have changed
+    scene_uniforms.update(camera, viewport)
     glEnable(GL_DEPTH_TEST)
-    glEnable(GL_LIGHTING)
-    
-    # Optimized lighting settings
-    glLightfv(GL_LIGHT0, GL_POSITION, (0, 25, 0, 1))  # Moved light higher
-    glLightfv(GL_LIGHT0, GL_AMBIENT, (0.2, 0.2, 0.2, 1))  # Reduced ambient
-    glLightfv(GL_LIGHT0, GL_DIFFUSE, (0.6, 0.6, 0.6, 1))  # Adjusted diffuse
-    glLightfv(GL_LIGHT0, GL_SPECULAR, (0.1, 0.1, 0.1, 1))  # Reduced specular
-    glEnable(GL_LIGHT0)
-    
-    # Optimized material settings
-    glEnable(GL_COLOR_MATERIAL)
-    glColorMaterial(GL_FRONT_AND_BACK, GL_AMBIENT_AND_DIFFUSE)
-    glMaterialfv(GL_FRONT_AND_BACK, GL_SPECULAR, (0.03, 0.03, 0.03, 1))
-    glMaterialf(GL_FRONT_AND_BACK, GL_SHININESS, 8.0)
 
 # Initialize Pygame and OpenGL
 pygame.init()
@@ -157,96 +302,152 @@ screen = pygame.display.set_mode((screen_width, screen_height), DOUBLEBUF | OPEN
 
 
 camera = Camera(60, (screen_width / screen_height), 0.01, 1000.0)
+scene_uniforms = SceneUniforms()
 
 sky = Sky()
 
-sand_storm = SandStorm(pygame.Vector3(0, 14, 0), num_particles=0, max_particles=particle_count_slider.value)
+sand_storm = SandStorm(pygame.Vector3(0, 14, 0), num_particles=0, max_particles=particle_count_slider.value,
+                       capacity=particle_count_slider.max_val, seed=SIMULATION_SEED)
+
+if args.record:
+    sand_storm.start_recording(args.record)
+
+# Recorded frames are drawn instead of the simulated ones in replay mode
+player = FramePlayer(args.replay) if args.replay else None
+replay_frame = 0
 
-ground = Ground()
+# Lowers the particle cap, emission and level of detail when frames take longer than 1 / FPS
+quality = QualityController(1000 / FPS) if player is None and not args.fixed_quality else None
 
-terrain = Terrain()
+ground = Ground(sand_storm.random.get("ground"))
+
+# Tiles of terrain streamed around the camera, the storm blows over the
+# height map around the origin, which is the same ground as the center tile
+terrain = ChunkedTerrain()
+height_map = HeightMap()
+
+# Control panel, drawn into a texture and redrawn only when it changes
+panel_target = RenderTarget(PANEL_WIDTH, screen_height)
+panel_key = None
+panel_vertices = None
+panel_tex_coords = np.array(quad(0, 1, 1, 0), dtype=np.float32)
 
 # Main game loop
 clock = pygame.time.Clock()
 done = False
 
+# The storm advances in fixed steps, as many as the real time of a frame covers
+timestep = FixedTimestep()
+last_frame_start = time.perf_counter()
+
+# Values of the sliders, pushed to the storm once per frame when they change
+parameters = Parameters()
+
+# Frame timings
+profiler = FrameProfiler(PROFILED_STAGES)
+show_profiler = False
+overlay_quads = None
+overlay_height = 0
+
 
 pygame.event.set_grab(True)
 pygame.mouse.set_visible(False)
 pygame.mouse.set_pos(screen_width // 2, screen_height // 2)
 
 while not done:
+    profiler.begin_frame()
+
     # Handle events
-    events = pygame.event.get()
-    for event in events:
-        if event.type == pygame.QUIT:
-            done = True
-        elif event.type == pygame.KEYDOWN:
-            if event.key == pygame.K_ESCAPE:
-                pygame.mouse.set_visible(True)
-                pygame.event.set_grab(False)
+    with profiler.stage("events"):
+        events = pygame.event.get()
+        for event in events:
+            if event.type == pygame.QUIT:
                 done = True
-            elif event.key == pygame.K_TAB:
-                if pygame.mouse.get_visible():
-                    pygame.mouse.set_visible(False)
-                    pygame.event.set_grab(True)
-                    pygame.mouse.set_pos(screen_width // 2, screen_height // 2)
-                else:
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
                     pygame.mouse.set_visible(True)
                     pygame.event.set_grab(False)
-        
-        # Handle slider events
-        wind_slider.handle_event(event)
-        wind_strength_slider.handle_event(event)
-        particle_count_slider.handle_event(event)
-        particle_mass_slider.handle_event(event)
-        particle_lifetime_slider.handle_event(event)
-
-        sky_b_slider.handle_event(event)
-        
-        # Update sand storm parameters based on slider values
-        angle = math.radians(wind_slider.value)
-        wind_direction = pygame.Vector3(math.cos(angle), 0, math.sin(angle)) * wind_strength_slider.value
-        sand_storm.set_wind(wind_direction)
-        sand_storm.set_max_particles(int(particle_count_slider.value))
-        
-        # Update all other parameters
-        sand_storm.set_parameters(
-            wind_strength=wind_strength_slider.value,
-            particle_mass=particle_mass_slider.value,
-            particle_lifetime=particle_lifetime_slider.value,
-        )
+                    done = True
+                elif event.key == pygame.K_TAB:
+                    if pygame.mouse.get_visible():
+                        pygame.mouse.set_visible(False)
+                        pygame.event.set_grab(True)
+                        pygame.mouse.set_pos(screen_width // 2, screen_height // 2)
+                    else:
+                        pygame.mouse.set_visible(True)
+                        pygame.event.set_grab(False)
+                elif event.key == pygame.K_F3:
+                    show_profiler = not show_profiler
+                elif event.key == pygame.K_F4:
+                    export_trace()
+                elif player is not None and event.key in (pygame.K_LEFT, pygame.K_RIGHT):
+                    step = REPLAY_SEEK_FRAMES if event.key == pygame.K_RIGHT else -REPLAY_SEEK_FRAMES
+                    replay_frame = min(max(replay_frame + step, 0), len(player) - 1)
+            
+            # Handle slider events
+            for slider in sliders:
+                slider.handle_event(event)
+
+        # Update the storm once, with the parameters changed by all events of this frame
+        read_sliders()
+        apply_parameter_changes(parameters.take_changes())
 
     # Clear screen and depth buffer
     glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
     
     
-    camera.update()
+    with profiler.stage("camera"):
+        camera.update()
+        frustum = Frustum.from_camera(camera)
 
     
-    glPushMatrix()
     set_3d()
     
-    # Update and draw sand storm with optimized delta time
-    dt = min(clock.get_time() / 1000.0, 1/30)  
-    sand_storm.update(dt, terrain)
-    sand_storm.draw()
+    # Update the sand storm with fixed steps and draw it between the last two
+    frame_start = time.perf_counter()
+    steps = timestep.advance(frame_start - last_frame_start)
+    last_frame_start = frame_start
+    if player is None:
+        with profiler.stage("storm update"):
+            for _ in range(steps):
+                sand_storm.update(timestep.step, height_map)
+        with profiler.stage("storm draw"):
+            sand_storm.draw(camera.get_position(), frustum, timestep.alpha)
+    elif len(player):
+        with profiler.stage("storm draw"):
+            sand_storm.draw_particles(*player.frame(replay_frame), camera.get_position(), frustum)
+        # Play the recording in a loop
+        replay_frame = (replay_frame + 1) % len(player)
     
-    # Update sky colors
-    sky.update_colors(sky_b_slider.value)
+    # Draw the sky
+    with profiler.stage("sky"):
+        sky.draw()
     
     # Draw ground and terrain
-    sky.draw()
-    ground.draw()
-    terrain.draw()
-    
-    glPopMatrix()
+    with profiler.stage("ground"):
+        ground.draw(frustum)
+    with profiler.stage("terrain"):
+        terrain.update(camera.position)
+        terrain.draw(frustum)
 
     
-    set_2d()
-    draw_control_panel()
-
-    pygame.display.flip()
+    with profiler.stage("panel"):
+        set_2d()
+        draw_cached_control_panel()
+        if show_profiler:
+            draw_profiler_overlay()
+
+    with profiler.stage("swap"):
+        pygame.display.flip()
+    profiler.end_frame()
+    if quality is not None:
+        quality_changes = quality.update(profiler)
+        if quality_changes:
+            apply_quality_changes(quality_changes)
     clock.tick(FPS)
 
+sand_storm.close()
+terrain.close()
+if player is not None:
+    player.close()
 pygame.quit()
@@ -0,0 +1,146 @@
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+# PyOpenGL picks its platform when it is first imported, and Mesa needs
+# no display with the surfaceless EGL platform
+os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+
+import argparse
+import math
+import time
+import pygame
+from OpenGL.GL import *
+from src.Offscreen import OffscreenContext
+from src.RenderTarget import RenderTarget
+from src.FrameReadback import FrameReadback
+from src.FrameWriter import FrameWriter, FORMATS
+from src.Camera import Camera
+from src.Frustum import Frustum
+from src.SceneUniforms import SceneUniforms
+from src.SandStorm import SandStorm
+from src.Ground import Ground
+from src.HeightMap import HeightMap
+from src.ChunkedTerrain import ChunkedTerrain
+from src.Sky import Sky
+from src.Recording import FramePlayer
+
+"""
+Offscreen sand storm renderer.
+It draws the same 3D scene as main.py (without the control panel) at a
+fixed resolution into a software OpenGL context from Mesa, with no window
+and no display. Time is simulated with a fixed step as in headless.py.
+Frames are read back through pixel buffer objects and written by a
+background thread, so the render loop does not wait for either. It is
+used for regression images and videos.
+
+Usage: python render.py --frames 600 --output frames
+       python render.py --frames 600 --format raw --output storm.rgb
+       python render.py --replay storm.rec --output frames
+Set PYOPENGL_PLATFORM=osmesa to render with OSMesa instead of EGL.
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Render the sand storm to image files without a display")
+    parser.add_argument("--frames", type=int, default=600, help="number of frames to render")
+    parser.add_argument("--width", type=int, default=1280, help="width of the frames in pixels")
+    parser.add_argument("--height", type=int, default=720, help="height of the frames in pixels")
+    parser.add_argument("--dt", type=float, default=1 / 60, help="simulated seconds per frame")
+    parser.add_argument("--particles", type=int, default=1000, help="maximum number of particles")
+    parser.add_argument("--wind-direction", type=float, default=0.0, help="wind direction in degrees")
+    parser.add_argument("--wind-strength", type=float, default=5.0, help="wind strength")
+    parser.add_argument("--mass", type=float, default=0.5, help="particle mass")
+    parser.add_argument("--lifetime", type=float, default=1.0, help="particle lifetime")
+    parser.add_argument("--sky-blue", type=float, default=0.0, help="blue component of the sky (0-255)")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the simulation, runs with the same seed give the same frames")
+    parser.add_argument("--camera", type=float, nargs=3, default=None, metavar=("X", "Y", "Z"), help="camera position")
+    parser.add_argument("--yaw", type=float, default=0.0, help="camera yaw in degrees")
+    parser.add_argument("--pitch", type=float, default=0.0, help="camera pitch in degrees")
+    parser.add_argument("--replay", default=None, help="render the frames of a recording instead of simulating")
+    parser.add_argument("--format", choices=FORMATS, default="png", help="PNG sequence or one raw RGB video file")
+    parser.add_argument("--output", default="frames", help="directory of the PNG files or path of the raw video")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    context = OffscreenContext(args.width, args.height)
+
+    camera = Camera(60, args.width / args.height, 0.01, 1000.0)
+    if args.camera is not None:
+        camera.position = pygame.Vector3(*args.camera)
+    camera.yaw, camera.pitch = args.yaw, args.pitch
+    camera.update_view_matrix()
+    frustum = Frustum.from_camera(camera)
+
+    sky = Sky()
+    sky.update_colors(args.sky_blue)
+    sand_storm = SandStorm(pygame.Vector3(0, 14, 0), num_particles=0, max_particles=args.particles, seed=args.seed)
+    ground = Ground(sand_storm.random.get("ground"))
+    height_map = HeightMap()
+    # The camera does not move, so all tiles around it are loaded before the first frame
+    terrain = ChunkedTerrain()
+    terrain.update(camera.position, wait=True)
+
+    # Same parameter mapping as the sliders in main.py
+    angle = math.radians(args.wind_direction)
+    sand_storm.set_wind(pygame.Vector3(math.cos(angle), 0, math.sin(angle)) * args.wind_strength)
+    sand_storm.set_parameters(
+        wind_strength=args.wind_strength,
+        particle_mass=args.mass,
+        particle_lifetime=args.lifetime,
+    )
+    player = FramePlayer(args.replay) if args.replay else None
+    frames = min(args.frames, len(player)) if player is not None else args.frames
+
+    # The scene is drawn into a texture with a depth buffer, the pbuffer of the context is not used
+    target = RenderTarget(args.width, args.height, depth=True)
+    readback = FrameReadback(args.width, args.height)
+    writer = FrameWriter(args.output, args.format)
+
+    # The camera does not move, so the scene uniforms are uploaded once for all frames
+    scene_uniforms = SceneUniforms()
+    scene_uniforms.update(camera, (0, 0, args.width, args.height))
+
+    target.begin()
+    glEnable(GL_DEPTH_TEST)
+    start = time.perf_counter()
+    for frame in range(frames):
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        if player is None:
+            sand_storm.update(args.dt, height_map)
+            sand_storm.draw(camera.get_position(), frustum)
+        else:
+            sand_storm.draw_particles(*player.frame(frame), camera.get_position(), frustum)
+        sky.draw()
+        ground.draw(frustum)
+        terrain.draw(frustum)
+
+        for index, pixels in readback.read(frame):
+            writer.write(index, pixels)
+    for index, pixels in readback.flush():
+        writer.write(index, pixels)
+    rendered = time.perf_counter() - start
+    writer.close()
+    elapsed = time.perf_counter() - start
+    target.end()
+
+    readback.delete()
+    target.delete()
+    scene_uniforms.delete()
+    sand_storm.close()
+    terrain.close()
+    if player is not None:
+        player.close()
+    context.close()
+
+    print(f"Rendered {frames} frames of {args.width}x{args.height} in {rendered:.3f} s, "
+          f"{rendered / max(frames, 1) * 1000:.2f} ms per frame")
+    print(f"Wrote {writer.frames_written} frames to {args.output} in {elapsed:.3f} s")
+    if args.format == "raw":
+        print(f"Encode with: ffmpeg -f rawvideo -pix_fmt rgb24 -s {args.width}x{args.height} "
+              f"-r {round(1 / args.dt)} -i {args.output} storm.mp4")
+
+
+if __name__ == "__main__":
+    main()
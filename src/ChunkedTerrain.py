@@ -0,0 +1,227 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from OpenGL.GL import *
+from src.consts import *
+from src.HeightMap import generate_lattice
+from src.Noise import SimplexNoise
+from src.SurfaceShader import get_surface_program
+
+
+def build_tile(noise, seed: int, key, cells: int, resolution=TERRAIN_RESOLUTION, size=TERRAIN_SIZE):
+    """
+    Generate the mesh of one terrain tile, runs in the worker threads
+    Args:
+        noise: SimplexNoise of the seed
+        key: (i, j) index of the tile, tile (0, 0) is centered on the origin
+        cells: Grid cells along each side of the tile, a divisor of resolution
+        resolution, size: Lattice points and size of one tile, as in HeightMap
+    Returns:
+        (vertices, colors, indices) arrays for the GPU, the grid vertices are followed by the skirt
+    """
+    # Lattice points of the grid, neighbouring tiles share the points on their edges
+    offsets = np.arange(cells + 1) * (resolution // cells) - resolution / 2
+    gi, gj = np.meshgrid(key[0] * resolution + offsets, key[1] * resolution + offsets, indexing="ij")
+    heights, colors = generate_lattice(noise, seed, gi, gj, resolution)
+    spacing = size / resolution
+    grid = np.stack((gi * spacing, heights, gj * spacing), axis=-1).reshape(-1, 3)
+    colors = colors.reshape(-1, 4)
+
+    # Two triangles for every cell, the same as in HeightMap
+    side = cells + 1
+    rows = np.arange(cells)
+    v0 = (rows[:, None] * side + rows[None, :]).ravel()
+    v1 = v0 + 1
+    v2 = v0 + side
+    v3 = v2 + 1
+    triangles = np.stack((v0, v1, v2, v1, v3, v2), axis=-1).ravel()
+
+    # The edge of the tile goes around once, and a copy of it lower down closes the
+    # cracks where a neighbour with a coarser grid does not meet every edge vertex
+    index = np.arange(side * side).reshape(side, side)
+    ring = np.concatenate((index[0, :-1], index[:-1, -1], index[-1, :0:-1], index[:0:-1, 0]))
+    ring_next = np.roll(ring, -1)
+    skirt = len(grid) + np.arange(len(ring))
+    skirt_next = np.roll(skirt, -1)
+    walls = np.stack((ring, ring_next, skirt, ring_next, skirt_next, skirt), axis=-1).ravel()
+
+    vertices = np.concatenate((grid, grid[ring] - (0.0, TERRAIN_SKIRT_DEPTH, 0.0))).astype(np.float32)
+    colors = np.concatenate((colors, colors[ring])).astype(np.float32)
+    indices = np.concatenate((triangles, walls)).astype(np.uint32)
+    return vertices, colors, indices
+
+
+"""
+This is a class describing one uploaded terrain tile.
+It is used to:
+- upload the vertices, colors and indices of a tile to the GPU
+- keep the bounding box and the memory of the tile
+- draw and delete the tile
+"""
+class TerrainTile:
+    def __init__(self, vertices: np.ndarray, colors: np.ndarray, indices: np.ndarray):
+        self.low = vertices.min(axis=0)
+        self.high = vertices.max(axis=0)
+        self.count = len(indices)
+        self.nbytes = vertices.nbytes + colors.nbytes + indices.nbytes
+
+        # Same layout as the height map buffers: positions in attribute 0, colors in attribute 1
+        self.vao = glGenVertexArrays(1)
+        glBindVertexArray(self.vao)
+        self.vbo, self.cbo, self.ibo = (int(buffer) for buffer in glGenBuffers(3))
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 0, None)
+        glEnableVertexAttribArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, self.cbo)
+        glBufferData(GL_ARRAY_BUFFER, colors.nbytes, colors, GL_STATIC_DRAW)
+        glVertexAttribPointer(1, 4, GL_FLOAT, GL_FALSE, 0, None)
+        glEnableVertexAttribArray(1)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def draw(self):
+        glBindVertexArray(self.vao)
+        glDrawElements(GL_TRIANGLES, self.count, GL_UNSIGNED_INT, None)
+        glBindVertexArray(0)
+
+    def delete(self):
+        glDeleteVertexArrays(1, [self.vao])
+        glDeleteBuffers(3, [self.vbo, self.cbo, self.ibo])
+
+
+"""
+This is a class describing the endless terrain streamed around the camera.
+The terrain is split into square tiles of TERRAIN_SIZE, all windows onto
+the same lattice as the height map. The tiles around the camera are
+generated on demand by a pool of worker threads, with coarser grids for
+farther tiles, and only a few finished tiles are uploaded to the GPU in
+every frame, so moving into new ground never stalls a frame. Uploaded
+tiles are kept in least recently drawn order and evicted when their
+buffers take more than the memory budget.
+It is used to:
+- choose the tiles and grids around the camera
+- generate the tiles in the background and upload them a few at a time
+- draw the tiles inside the view, with any grid already uploaded until the right one is ready
+- evict the least recently drawn tiles above the memory budget
+"""
+class ChunkedTerrain:
+    def __init__(self, seed=TERRAIN_SEED, view_tiles: int = TERRAIN_VIEW_TILES,
+                 memory_budget: int = TERRAIN_MEMORY_BUDGET, workers: int = TERRAIN_WORKERS):
+        """
+        Args:
+            seed: Seed of the terrain, the same as for the height map the storm uses
+            view_tiles: Tiles drawn in every direction from the tile of the camera
+            memory_budget: Bytes of tile buffers kept on the GPU
+            workers: Number of threads generating tiles
+        """
+        self.seed = seed
+        self.view_tiles = view_tiles
+        self.memory_budget = memory_budget
+        # Read-only after creation, so the worker threads share it
+        self.noise = SimplexNoise(seed)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="terrain")
+        self.program = get_surface_program()
+
+        # Uploaded tiles by (key, cells), the least recently drawn first
+        self.tiles = OrderedDict()
+        # Grids uploaded for every key
+        self.grids = {}
+        self.memory = 0
+        # Jobs of the worker threads by (key, cells)
+        self.pending = {}
+        # (key, cells) of the tiles around the camera, nearest first
+        self.wanted = []
+
+        # Tile offsets around the camera, nearest first, with the grid for their distance
+        radius = range(-view_tiles, view_tiles + 1)
+        offsets = sorted(((i, j) for i in radius for j in radius), key=lambda offset: offset[0] ** 2 + offset[1] ** 2)
+        self.offsets = [(i, j, TERRAIN_LOD_CELLS[min(max(abs(i), abs(j)), len(TERRAIN_LOD_CELLS) - 1)])
+                        for i, j in offsets]
+
+    def tile_of(self, position):
+        """Key of the tile containing a position"""
+        return (int(np.floor(position[0] / TERRAIN_SIZE + 0.5)),
+                int(np.floor(position[2] / TERRAIN_SIZE + 0.5)))
+
+    def update(self, position, wait: bool = False):
+        """
+        Request the tiles around a position and upload finished ones, call once per frame
+        Args:
+            position: Position of the camera
+            wait: Wait for all tiles around the position and upload them at once
+        """
+        ci, cj = self.tile_of(position)
+        self.wanted = [((ci + i, cj + j), cells) for i, j, cells in self.offsets]
+        wanted = set(self.wanted)
+
+        # Jobs for tiles the camera has left are dropped, unless they are already running
+        for name, future in list(self.pending.items()):
+            if name not in wanted and (future.cancel() or future.done()):
+                del self.pending[name]
+        for name in self.wanted:
+            if name not in self.tiles and name not in self.pending:
+                self.pending[name] = self.executor.submit(build_tile, self.noise, self.seed, *name)
+
+        # Nearest tiles first, only a few per frame
+        ready = [name for name in self.wanted if name in self.pending and (wait or self.pending[name].done())]
+        for name in ready if wait else ready[:TERRAIN_UPLOADS_PER_FRAME]:
+            tile = TerrainTile(*self.pending.pop(name).result())
+            self.tiles[name] = tile
+            self.grids.setdefault(name[0], set()).add(name[1])
+            self.memory += tile.nbytes
+        self._evict(wanted)
+
+    def _evict(self, keep):
+        """Delete the least recently drawn tiles until the memory fits the budget"""
+        for name in list(self.tiles):
+            if self.memory <= self.memory_budget:
+                break
+            if name in keep:
+                continue
+            tile = self.tiles.pop(name)
+            self.grids[name[0]].discard(name[1])
+            self.memory -= tile.nbytes
+            tile.delete()
+
+    def draw(self, frustum=None):
+        """
+        Args:
+            frustum: View frustum, tiles outside it are skipped. None draws all tiles around the camera.
+        """
+        names = []
+        for key, cells in self.wanted:
+            if (key, cells) not in self.tiles:
+                # Until its grid is ready a tile is drawn with the finest grid it already has
+                grids = self.grids.get(key)
+                if not grids:
+                    continue
+                cells = max(grids)
+            names.append((key, cells))
+        if not names:
+            return
+
+        tiles = [self.tiles[name] for name in names]
+        visible = np.ones(len(tiles), dtype=bool)
+        if frustum is not None:
+            visible = frustum.boxes_visible(np.array([tile.low for tile in tiles]),
+                                            np.array([tile.high for tile in tiles]))
+        glUseProgram(self.program)
+        for name, tile, shown in zip(names, tiles, visible):
+            # Tiles around the camera count as used even outside the view, it may turn back to them
+            self.tiles.move_to_end(name)
+            if shown:
+                tile.draw()
+        glUseProgram(0)
+
+    def close(self):
+        """Stop the worker threads and free the tile buffers"""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.pending.clear()
+        for tile in self.tiles.values():
+            tile.delete()
+        self.tiles.clear()
+        self.grids.clear()
+        self.memory = 0
@@ -0,0 +1,94 @@
+import numpy as np
+from src.consts import EMISSION_BASE_WEIGHT, EMISSION_HEIGHT_WEIGHT, EMISSION_EXPOSURE_WEIGHT
+
+
+def alias_table(weights: np.ndarray):
+    """
+    Alias table of a discrete distribution (Vose's method). Every slot i
+    keeps its own index with the given probability and the alias index
+    otherwise, so a sample takes one random number and no search.
+    Args:
+        weights: Array of non-negative weights, not all zero
+    Returns:
+        (probabilities, aliases) arrays with one entry per weight
+    """
+    count = len(weights)
+    scaled = (weights * (count / weights.sum())).tolist()
+    probabilities = np.ones(count)
+    aliases = np.arange(count)
+    small = [index for index, value in enumerate(scaled) if value < 1.0]
+    large = [index for index, value in enumerate(scaled) if value >= 1.0]
+    while small and large:
+        less, more = small.pop(), large.pop()
+        probabilities[less] = scaled[less]
+        aliases[less] = more
+        # The rest of the slot of less is taken from more
+        scaled[more] -= 1.0 - scaled[less]
+        (small if scaled[more] < 1.0 else large).append(more)
+    # Slots left over keep their own index, up to rounding their value is 1
+    return probabilities, aliases
+
+
+"""
+This is a class describing where sand leaves the terrain.
+Every terrain vertex gets a weight from its height and from how much its
+slope faces the wind, and an alias table of the weights is kept, so any
+number of source vertices is drawn with a few array operations on one
+array of random numbers. The features of the vertices are computed once
+per terrain, the weights and the table only when the wind turns.
+It is used to:
+- compute the height and slope of every terrain vertex
+- weight the vertices by their exposure to the wind
+- draw source vertices from the weighted distribution
+"""
+class EmissionMap:
+    def __init__(self, terrain):
+        """
+        Args:
+            terrain: HeightMap or Terrain the sand comes from
+        """
+        self.terrain = terrain
+        self.vertices = np.asarray(terrain.get_vertices(), dtype=np.float64).reshape(-1, 3)
+        heights = self.vertices[:, 1]
+        span = np.ptp(heights)
+        self.height = (heights - heights.min()) / span if span > 0 else np.zeros_like(heights)
+        # Horizontal part of the surface normal, it grows with the slope and points downhill
+        _, normals = terrain.sample_surface(self.vertices[:, 0], self.vertices[:, 2])
+        self.downhill = normals[:, [0, 2]]
+        self.wind_direction = None
+        self.probabilities = None
+        self.aliases = None
+
+    def set_wind(self, wind):
+        """
+        Recompute the weights for a new wind direction, the strength does not matter
+        Args:
+            wind: Wind vector, only its X and Z components are used
+        """
+        direction = np.array([wind[0], wind[2]], dtype=np.float64)
+        length = np.hypot(*direction)
+        direction = direction / length if length > 0 else np.zeros(2)
+        if self.wind_direction is not None and np.array_equal(direction, self.wind_direction):
+            return
+        self.wind_direction = direction
+
+        # A slope faces the wind when its normal points against it
+        exposure = np.maximum(-(self.downhill @ direction), 0.0)
+        weights = EMISSION_BASE_WEIGHT + EMISSION_HEIGHT_WEIGHT * self.height + EMISSION_EXPOSURE_WEIGHT * exposure
+        self.probabilities, self.aliases = alias_table(weights)
+
+    def sample(self, rng, count: int):
+        """
+        Draw source vertices, with replacement
+        Args:
+            rng: NumPy random generator
+            count: Number of vertices to draw
+        Returns:
+            Array of vertex indices
+        """
+        # The integer part of a random number picks a slot, the fraction decides between its two indices
+        slots = rng.random(count)
+        slots *= len(self.vertices)
+        indices = slots.astype(np.int64)
+        slots -= indices
+        return np.where(slots < self.probabilities[indices], indices, self.aliases[indices])
@@ -0,0 +1,52 @@
+from src.consts import SIMULATION_STEP, MAX_CATCH_UP_STEPS
+
+"""
+This is a class describing the fixed-step scheduler of the simulation.
+The real time of every frame is added to an accumulator, and the storm
+is advanced by as many whole steps as fit in it, zero or more per frame.
+So the physics always sees the same step and gives the same results at
+any frame rate. The time left in the accumulator, as a part of a step,
+tells the renderer how far to interpolate between the last two steps.
+After a long stall at most max_steps steps run in one frame and the rest
+of the time is dropped, so a slow frame cannot start a spiral of ever
+more catch-up steps.
+It is used to:
+- turn the real time of a frame into a number of simulation steps
+- give the interpolation factor for drawing between steps
+- count the time dropped by the catch-up limit
+"""
+class FixedTimestep:
+    def __init__(self, step: float = SIMULATION_STEP, max_steps: int = MAX_CATCH_UP_STEPS):
+        """
+        Args:
+            step: Simulated seconds per step
+            max_steps: Most steps run in one frame
+        """
+        self.step = step
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+        self.dropped_time = 0.0
+
+    def advance(self, elapsed: float):
+        """
+        Add the real time of a frame
+        Args:
+            elapsed: Seconds since the last call
+        Returns:
+            Number of steps to run in this frame
+        """
+        self.accumulator += elapsed
+        steps = int(self.accumulator // self.step)
+        self.accumulator -= steps * self.step
+        if steps > self.max_steps:
+            self.dropped_time += (steps - self.max_steps) * self.step
+            steps = self.max_steps
+        return steps
+
+    @property
+    def alpha(self):
+        """
+        Part of a step left in the accumulator. Drawing lags one step behind, 0 draws
+        the particles as they were before the last step and 1 as they are after it.
+        """
+        return min(self.accumulator / self.step, 1.0)
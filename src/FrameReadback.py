@@ -0,0 +1,93 @@
+import ctypes
+from collections import deque
+import numpy as np
+from OpenGL.GL import *
+
+# Pixel buffers in flight, a frame is mapped READBACK_BUFFERS - 1 frames after it was drawn
+READBACK_BUFFERS = 3
+
+"""
+This is a class describing the asynchronous readback of rendered frames.
+glReadPixels into client memory waits until the GPU has finished the
+frame. Here every frame is copied into one of a ring of pixel buffer
+objects instead, which returns at once, and a buffer is mapped only
+later, when its fence says the copy is done or when the ring is full.
+It is used to:
+- start copying the current read framebuffer into a free pixel buffer
+- hand back the frames whose copy has finished
+- wait for the remaining frames at the end
+"""
+class FrameReadback:
+    def __init__(self, width: int, height: int, buffers: int = READBACK_BUFFERS):
+        """
+        Args:
+            width, height: Size of the frames in pixels
+            buffers: Number of pixel buffers in the ring
+        """
+        self.width = width
+        self.height = height
+        self.frame_bytes = width * height * 4
+        self.buffers = [int(buffer) for buffer in np.atleast_1d(glGenBuffers(buffers))]
+        for buffer in self.buffers:
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, buffer)
+            glBufferData(GL_PIXEL_PACK_BUFFER, self.frame_bytes, None, GL_STREAM_READ)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self.free = list(self.buffers)
+        # (buffer, fence, tag) of the copies in flight, oldest first
+        self.pending = deque()
+
+    def read(self, tag):
+        """
+        Start copying the current read framebuffer
+        Args:
+            tag: Value returned with the pixels of this frame, such as its index
+        Returns:
+            List of (tag, pixels) of earlier frames that are ready, pixels are
+            RGBA arrays of shape (height, width, 4) with the bottom row first
+        """
+        ready = []
+        if not self.free:
+            ready.append(self._finish())
+
+        buffer = self.free.pop()
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, buffer)
+        # With a pack buffer bound the pointer is an offset into the buffer
+        glReadPixels(0, 0, self.width, self.height, GL_RGBA, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self.pending.append((buffer, glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0), tag))
+
+        # Frames that finished in the meantime, checked without waiting
+        while self.pending and glClientWaitSync(self.pending[0][1], 0, 0) in (GL_ALREADY_SIGNALED,
+                                                                               GL_CONDITION_SATISFIED):
+            ready.append(self._finish())
+        return ready
+
+    def _finish(self):
+        """Wait for the oldest copy and take its pixels out of the buffer"""
+        buffer, fence, tag = self.pending.popleft()
+        glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, GL_TIMEOUT_IGNORED)
+        glDeleteSync(fence)
+
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, buffer)
+        pointer = glMapBufferRange(GL_PIXEL_PACK_BUFFER, 0, self.frame_bytes, GL_MAP_READ_BIT)
+        # The mapping is gone after unmapping, so the pixels are copied out
+        pixels = np.empty((self.height, self.width, 4), dtype=np.uint8)
+        ctypes.memmove(pixels.ctypes.data, pointer, self.frame_bytes)
+        glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self.free.append(buffer)
+        return tag, pixels
+
+    def flush(self):
+        """
+        Wait for all copies in flight
+        Returns:
+            List of (tag, pixels), see read
+        """
+        return [self._finish() for _ in range(len(self.pending))]
+
+    def delete(self):
+        for _, fence, _ in self.pending:
+            glDeleteSync(fence)
+        self.pending.clear()
+        glDeleteBuffers(len(self.buffers), self.buffers)
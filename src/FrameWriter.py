@@ -0,0 +1,88 @@
+import os
+import queue
+import threading
+import numpy as np
+import pygame
+
+# Frames waiting for the writer, the renderer blocks when the writer falls this far behind
+WRITER_QUEUE_SIZE = 8
+
+FORMATS = ("png", "raw")
+
+"""
+This is a class describing the writer of rendered frames.
+Encoding and writing a frame takes longer than drawing it, so it runs in
+a background thread and the render loop only puts the pixels in a queue.
+Frames are written as a numbered PNG sequence or appended to one raw RGB
+video file (for example for ffmpeg -f rawvideo -pix_fmt rgb24).
+It is used to:
+- queue frames for writing
+- write them in a background thread, top row first and without alpha
+- wait for the queued frames and report errors of the thread
+"""
+class FrameWriter:
+    def __init__(self, path: str, format: str = "png", queue_size: int = WRITER_QUEUE_SIZE):
+        """
+        Args:
+            path: Directory of the PNG files, or the raw video file
+            format: "png" or "raw"
+            queue_size: Number of frames that can wait for the writer
+        """
+        if format not in FORMATS:
+            raise ValueError(f"Unknown frame format {format}, expected one of {FORMATS}")
+        self.path = path
+        self.format = format
+        self.frames_written = 0
+        self.error = None
+        if format == "png":
+            os.makedirs(path, exist_ok=True)
+            self.file = None
+        else:
+            self.file = open(path, "wb")
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self._run, name="FrameWriter", daemon=True)
+        self.thread.start()
+
+    def write(self, index: int, pixels: np.ndarray):
+        """
+        Queue a frame
+        Args:
+            index: Number of the frame, used in the PNG file name
+            pixels: RGBA array of shape (height, width, 4) with the bottom row first, as read from OpenGL
+        """
+        if self.error is not None:
+            raise RuntimeError("Writing frames failed") from self.error
+        self.queue.put((index, pixels))
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            # After an error the queue is still emptied, so write never blocks forever
+            if self.error is None:
+                try:
+                    self._write(*item)
+                except Exception as error:
+                    self.error = error
+
+    def _write(self, index: int, pixels: np.ndarray):
+        # OpenGL rows start at the bottom of the image
+        image = np.ascontiguousarray(pixels[::-1, :, :3])
+        if self.format == "png":
+            height, width = image.shape[:2]
+            surface = pygame.image.frombuffer(image, (width, height), "RGB")
+            pygame.image.save(surface, os.path.join(self.path, f"frame_{index:05d}.png"))
+        else:
+            self.file.write(image)
+        self.frames_written += 1
+
+    def close(self):
+        """Wait until all queued frames are written"""
+        self.queue.put(None)
+        self.thread.join()
+        if self.file is not None:
+            self.file.close()
+        if self.error is not None:
+            raise RuntimeError("Writing frames failed") from self.error
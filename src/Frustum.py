@@ -0,0 +1,60 @@
+import numpy as np
+
+"""
+This is a class describing the view frustum of the camera.
+The six planes of the frustum are taken from the product of the view and
+projection matrices, so they always match what is drawn. Whole arrays of
+bounding spheres or boxes are tested against all planes at once, and only
+the visible ones are sent to OpenGL.
+It is used to:
+- extract the frustum planes from the camera matrices
+- test arrays of bounding spheres against the frustum
+- test arrays of axis-aligned bounding boxes against the frustum
+"""
+class Frustum:
+    def __init__(self, projection, view):
+        """
+        Args:
+            projection, view: 4x4 matrices as passed to glLoadMatrixf, which
+                transform row vectors: clip = point @ view @ projection
+        """
+        matrix = np.asarray(view, dtype=np.float64) @ np.asarray(projection, dtype=np.float64)
+        w = matrix[:, 3]
+        # Inside means -w <= x, y, z <= w, one plane for every inequality.
+        # A point p is in front of a plane when p @ normal + distance >= 0.
+        planes = np.stack([w + matrix[:, axis] for axis in range(3)] +
+                          [w - matrix[:, axis] for axis in range(3)])
+        planes /= np.linalg.norm(planes[:, :3], axis=1, keepdims=True)
+        self.normals = planes[:, :3]
+        self.distances = planes[:, 3]
+
+    @classmethod
+    def from_camera(cls, camera):
+        return cls(camera.get_PPM(), camera.get_VM())
+
+    def spheres_visible(self, centers: np.ndarray, radii):
+        """
+        Args:
+            centers: Array of shape (N, 3)
+            radii: Array of shape (N,) or a single radius
+        Returns:
+            Boolean array, True for spheres at least partly inside the frustum
+        """
+        # Signed distance of every center from every plane, shape (N, 6)
+        distance = centers @ self.normals.T
+        distance += self.distances
+        distance += np.asarray(radii)[..., None]
+        return (distance >= 0).all(axis=1)
+
+    def boxes_visible(self, lows: np.ndarray, highs: np.ndarray):
+        """
+        Args:
+            lows, highs: Arrays of shape (N, 3) with the corners of the boxes
+        Returns:
+            Boolean array, True for boxes that may be inside the frustum
+        """
+        # For every plane the corner of the box farthest in front of it
+        positive = self.normals > 0
+        farthest = np.where(positive[None], highs[:, None], lows[:, None])
+        distance = np.einsum("npk,pk->np", farthest, self.normals) + self.distances
+        return (distance >= 0).all(axis=1)
@@ -1,16 +1,23 @@
+import ctypes
 import numpy as np
-import random
 from OpenGL.GL import *
 from src.consts import *
+from src.TileGrid import TileGrid
+from src.SurfaceShader import get_surface_program
 """
 This is a class describing the ground.
 It is used to:
 - generate the vertices and colors for the ground
-- draw the ground
+- draw the ground tiles inside the view
 - get the vertices of the ground
 """
 class Ground:
-    def __init__(self):
+    def __init__(self, rng=None):
+        """
+        Args:
+            rng: NumPy random generator for the color variation, defaults to one seeded with TERRAIN_SEED
+        """
+        rng = rng if rng is not None else np.random.default_rng(TERRAIN_SEED)
         # various colors of sand
         self.sand_colors = [
             [0.90, 0.85, 0.65],  
@@ -39,21 +46,16 @@ class Ground:
                 
                 #adding the vertices
                 self.vertices.extend([x, y, z])
-                
-                # generating the colors with random variation
-                base_color = random.choice(self.sand_colors)
-                variation = random.uniform(-0.2, 0.2)
-                
-                color = [
-                    base_color[0] + variation,
-                    base_color[1] + variation,
-                    base_color[2] + variation,
-                    1.0
-                ]
-                
-                # reducing color values
-                color = [max(0, min(1, c)) for c in color]
-                self.colors.extend(color)
+        
+        # generating the colors with random variation, all vertices at once
+        count = resolution * resolution
+        base_color = np.array(self.sand_colors)[rng.integers(len(self.sand_colors), size=count)]
+        variation = rng.uniform(-0.2, 0.2, count)
+        colors = np.ones((count, 4))
+        colors[:, :3] = base_color + variation[:, None]
+        
+        # reducing color values
+        self.colors = np.clip(colors, 0, 1).ravel()
         
         # generating the indices for the triangles
         for i in range(resolution - 1):
@@ -91,16 +93,25 @@ class Ground:
         glVertexAttribPointer(1, 4, GL_FLOAT, GL_FALSE, 0, None)
         glEnableVertexAttribArray(1)
         
-        # indices buffer
+        # indices buffer, the same triangles ordered tile by tile
+        self.tiles = TileGrid(self.vertices, resolution, TERRAIN_TILE_CELLS)
         glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
-        glBufferData(GL_ELEMENT_ARRAY_BUFFER, self.indices.nbytes, self.indices, GL_STATIC_DRAW)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, self.tiles.indices.nbytes, self.tiles.indices, GL_STATIC_DRAW)
         
         glBindVertexArray(0)
+        self.program = get_surface_program()
     
-    def draw(self):
+    def draw(self, frustum=None):
+        """
+        Args:
+            frustum: View frustum, tiles outside it are skipped. None draws all tiles.
+        """
+        glUseProgram(self.program)
         glBindVertexArray(self.vao)
-        glDrawElements(GL_TRIANGLES, len(self.indices), GL_UNSIGNED_INT, None)
+        for first, count in zip(*self.tiles.visible_ranges(frustum)):
+            glDrawElements(GL_TRIANGLES, int(count), GL_UNSIGNED_INT, ctypes.c_void_p(int(first) * 4))
         glBindVertexArray(0)
+        glUseProgram(0)
 
     def get_vertices(self):
         """Returns the vertices array of the ground."""
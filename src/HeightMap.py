@@ -0,0 +1,229 @@
+import os
+import numpy as np
+from src.consts import *
+from src.Noise import SimplexNoise
+
+"""
+This is a class describing the height map of the terrain.
+It does not use OpenGL, so it can be used by the simulation without a display.
+The height map, vertices, colors and indices are generated with array
+operations and cached on disk, so later runs with the same settings load
+them instead of generating them again.
+It is used to:
+- generate the height map
+- generate the vertices and colors for the terrain
+- save and load the generated terrain
+- get the vertices of the terrain
+- look up heights and normals of the terrain for arrays of positions
+"""
+
+# Generated terrain is stored here, one file per set of terrain settings
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "terrain")
+# Increase when the generation changes, so old cache files are not used
+CACHE_VERSION = 2
+
+# base colors of sand with higher contrast
+SAND_COLORS = np.array([
+    [0.90, 0.85, 0.65],
+    [0.75, 0.55, 0.35],
+    [0.65, 0.60, 0.45],
+    [0.85, 0.70, 0.40],
+    [0.70, 0.80, 0.60],
+    [0.80, 0.60, 0.30],
+])
+
+
+def sample_height_map(height_map: np.ndarray, size: float, x, z, with_normals=True):
+    """
+    Bilinear lookup of terrain heights and normals
+    Args:
+        height_map: Array of shape (R, R), vertex (i, j) lies at ((i / R - 0.5) * size, (j / R - 0.5) * size)
+        size: Size of the terrain
+        x, z: Arrays of positions, positions outside the terrain use the nearest edge
+        with_normals: Whether to compute the normals
+    Returns:
+        (heights, normals) with normals of shape (N, 3), or None when with_normals is False
+    """
+    resolution = height_map.shape[0]
+    cell = size / resolution
+
+    # Continuous grid coordinates, clamped to the grid
+    gx = np.clip((np.asarray(x) / size + 0.5) * resolution, 0, resolution - 1)
+    gz = np.clip((np.asarray(z) / size + 0.5) * resolution, 0, resolution - 1)
+    i = np.minimum(gx.astype(np.int64), resolution - 2)
+    j = np.minimum(gz.astype(np.int64), resolution - 2)
+    fx = gx - i
+    fz = gz - j
+
+    h00 = height_map[i, j]
+    h10 = height_map[i + 1, j]
+    h01 = height_map[i, j + 1]
+    h11 = height_map[i + 1, j + 1]
+    bottom = h00 + (h10 - h00) * fx
+    top = h01 + (h11 - h01) * fx
+    heights = bottom + (top - bottom) * fz
+    if not with_normals:
+        return heights, None
+
+    # Normal of the bilinear surface, from its slope along X and Z
+    slope_x = ((h10 - h00) * (1 - fz) + (h11 - h01) * fz) / cell
+    slope_z = (top - bottom) / cell
+    normals = np.stack((-slope_x, np.ones_like(slope_x), -slope_z), axis=-1)
+    normals /= np.linalg.norm(normals, axis=-1, keepdims=True)
+    return heights, normals
+
+
+def lattice_random(gi, gj, seed: int, salt: int):
+    """
+    Random numbers in [0, 1) that depend only on the lattice point, the seed
+    and the salt, so a point gets the same value in every map or tile
+    Args:
+        gi, gj: Arrays of lattice coordinates, whole or half numbers
+        salt: Number of the random quantity, different quantities are independent
+    """
+    # Half numbers become whole, then a 64-bit hash (the splitmix64 finalizer) of the point
+    ki = np.rint(np.asarray(gi) * 2).astype(np.int64).astype(np.uint64)
+    kj = np.rint(np.asarray(gj) * 2).astype(np.int64).astype(np.uint64)
+    key = np.uint64((seed * 1000003 + salt * 7919) & 0xFFFFFFFFFFFFFFFF)
+    with np.errstate(over="ignore"):
+        h = ki * np.uint64(0x9E3779B97F4A7C15) ^ kj * np.uint64(0xC2B2AE3D27D4EB4F) ^ key
+        h ^= h >> np.uint64(30)
+        h *= np.uint64(0xBF58476D1CE4E5B9)
+        h ^= h >> np.uint64(27)
+        h *= np.uint64(0x94D049BB133111EB)
+        h ^= h >> np.uint64(31)
+    return (h >> np.uint64(11)).astype(np.float64) / 2.0 ** 53
+
+
+def generate_lattice(noise, seed: int, gi, gj, resolution=TERRAIN_RESOLUTION, height=TERRAIN_HEIGHT,
+                     scale=TERRAIN_SCALE):
+    """
+    Heights and colors of the endless terrain at points of the world lattice.
+    Point (gi, gj) lies at X = gi * size / resolution and Z = gj * size / resolution,
+    so the height map and every streamed tile are windows onto the same terrain.
+    Args:
+        noise: SimplexNoise of the seed
+        gi, gj: Arrays of lattice coordinates with the same shape
+    Returns:
+        (heights, colors) with colors of shape gi.shape + (4,)
+    """
+    # Noise at (x_i, y_j), the map of the given resolution covers one unit of noise times the scale
+    x = (gi / resolution + 0.5) * scale
+    y = (gj / resolution + 0.5) * scale
+    # Large formations
+    heights = noise.noise2(x, y) * 3.0
+    # Medium details
+    heights += noise.noise2(x * 2, y * 2) * 1.5
+    # Small details
+    heights += noise.noise2(x * 4, y * 4) * 0.3
+
+    # adding random peaks
+    heights[lattice_random(gi, gj, seed, 0) < 0.1] *= 1.5
+
+    # increasing the height of the terrain
+    heights *= height * 1.5
+
+    # Calculate color based on height and random pattern
+    height_factor = (heights + height) / (2 * height)
+    # selection of the base color with random variation
+    base_color = SAND_COLORS[(lattice_random(gi, gj, seed, 1) * len(SAND_COLORS)).astype(np.int64)]
+    variation = lattice_random(gi, gj, seed, 2) * 0.4 - 0.2
+
+    colors = np.ones(heights.shape + (4,))
+    # adding gradient with random variation
+    colors[..., :3] = base_color + height_factor[..., None] * [0.3, 0.25, 0.2] + variation[..., None]
+    # reducing the color values to the range [0, 1]
+    return heights, np.clip(colors, 0, 1)
+
+
+class HeightMap:
+    def __init__(self, seed=TERRAIN_SEED, resolution=TERRAIN_RESOLUTION, size=TERRAIN_SIZE,
+                 height=TERRAIN_HEIGHT, scale=TERRAIN_SCALE, use_cache=True):
+        self.seed = seed
+        self.resolution = resolution
+        self.size = size
+        self.height = height
+        self.scale = scale
+
+        if not (use_cache and self._load()):
+            self._generate()
+            if use_cache:
+                self._save()
+
+    def _generate(self):
+        resolution = self.resolution
+        # Vertex (i, j) is the lattice point (i - resolution / 2, j - resolution / 2)
+        lattice = np.arange(resolution) - resolution / 2
+        gi, gj = np.meshgrid(lattice, lattice, indexing="ij")
+        self.height_map, colors = generate_lattice(SimplexNoise(self.seed), self.seed, gi, gj, resolution,
+                                                   self.height, self.scale)
+
+        # Generate vertices, vertex (i, j) lies at index i * resolution + j
+        spacing = self.size / resolution
+        self.vertices = np.stack((gi * spacing, self.height_map, gj * spacing), axis=-1).astype(np.float32).ravel()
+        self.colors = colors.astype(np.float32).ravel()
+
+        # Generate indices for triangles, two for every grid cell
+        cells = np.arange(resolution - 1)
+        v0 = (cells[:, None] * resolution + cells[None, :]).ravel()
+        v1 = v0 + 1
+        v2 = v0 + resolution
+        v3 = v2 + 1
+        self.indices = np.stack((v0, v1, v2, v1, v3, v2), axis=-1).astype(np.uint32).ravel()
+
+    def _cache_path(self):
+        name = (f"terrain_v{CACHE_VERSION}_seed{self.seed}_res{self.resolution}"
+                f"_size{self.size}_height{self.height}_scale{self.scale}.npz")
+        return os.path.join(CACHE_DIR, name)
+
+    def _load(self):
+        """
+        Load the terrain from the cache
+        Returns:
+            True if the terrain was loaded
+        """
+        try:
+            with np.load(self._cache_path()) as data:
+                self.height_map = data["height_map"]
+                self.vertices = data["vertices"]
+                self.colors = data["colors"]
+                self.indices = data["indices"]
+        except (OSError, KeyError, ValueError):
+            return False
+        return True
+
+    def _save(self):
+        """
+        Save the terrain to the cache, a failed write only skips the cache
+        """
+        path = self._cache_path()
+        temporary_path = path + ".tmp.npz"
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            np.savez(temporary_path, height_map=self.height_map, vertices=self.vertices,
+                     colors=self.colors, indices=self.indices)
+            # Replace in one step, so other runs never read a half-written file
+            os.replace(temporary_path, path)
+        except OSError:
+            pass
+
+    def get_vertices(self):
+        """
+        Returns the vertices array of the terrain.
+        Each vertex is represented by 3 float values (x, y, z).
+        """
+        return self.vertices
+
+    def sample_heights(self, x, z):
+        """
+        Returns the terrain heights at arrays of X and Z positions
+        """
+        return sample_height_map(self.height_map, self.size, x, z, with_normals=False)[0]
+
+    def sample_surface(self, x, z):
+        """
+        Returns the terrain heights and unit normals at arrays of X and Z positions
+        Returns:
+            (heights, normals) with heights of shape (N,) and normals of shape (N, 3)
+        """
+        return sample_height_map(self.height_map, self.size, x, z)
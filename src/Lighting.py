@@ -0,0 +1,21 @@
+"""
+Lighting of the 3D scene, shared by the window (main.py) and the
+offscreen renderer (render.py), so both draw the scene the same way.
+The light is a point light like GL_LIGHT0 with color material: its values
+go into the scene uniform buffer and every shader lights its colors with
+light_color.
+"""
+
+LIGHT_POSITION = (0.0, 25.0, 0.0)  # World position of the light, above the terrain
+LIGHT_AMBIENT = (0.4, 0.4, 0.4)  # Ambient of the light and of the scene, 0.2 each
+LIGHT_DIFFUSE = (0.6, 0.6, 0.6)
+
+# Diffuse lighting in eye space, the values come from the Scene block
+LIGHTING = """
+vec3 light_color(vec3 color, vec3 normal, vec3 eye) {
+    vec3 light = normalize(light_position.xyz - eye);
+    float diffuse = max(dot(normal, light), 0.0);
+    vec3 lit = color * (light_ambient.rgb + light_diffuse.rgb * diffuse);
+    return min(lit, vec3(1.0));
+}
+"""
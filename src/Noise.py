@@ -0,0 +1,138 @@
+import numpy as np
+
+"""
+This is a class describing 2D OpenSimplex noise evaluated with NumPy.
+It gives the same values as OpenSimplex(seed).noise2 from the opensimplex
+package, but a whole array of points is computed in a few array operations
+instead of one Python call per point.
+It is used to:
+- generate the permutation table from a seed
+- compute noise for arrays of x and y coordinates
+"""
+
+STRETCH_CONSTANT2 = -0.211324865405187  # (1/Math.sqrt(2+1)-1)/2
+SQUISH_CONSTANT2 = 0.366025403784439    # (Math.sqrt(2+1)-1)/2
+NORM_CONSTANT2 = 47
+
+# Gradients for 2D. They approximate the directions to the vertices of an octagon from the center.
+GRADIENTS2 = np.array([
+    5, 2, 2, 5,
+    -5, 2, -2, 5,
+    5, -2, 2, -5,
+    -5, -2, -2, -5,
+], dtype=np.int64)
+
+
+def _overflow(value):
+    """Wrap a Python integer to a signed 64-bit integer"""
+    value &= 0xFFFFFFFFFFFFFFFF
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _permutation(seed: int):
+    """
+    Generate the permutation table the same way as the opensimplex package
+    """
+    perm = np.zeros(256, dtype=np.int64)
+    source = list(range(256))
+    seed = _overflow(seed * 6364136223846793005 + 1442695040888963407)
+    seed = _overflow(seed * 6364136223846793005 + 1442695040888963407)
+    seed = _overflow(seed * 6364136223846793005 + 1442695040888963407)
+    for i in range(255, -1, -1):
+        seed = _overflow(seed * 6364136223846793005 + 1442695040888963407)
+        r = int((seed + 31) % (i + 1))
+        if r < 0:
+            r += i + 1
+        perm[i] = source[r]
+        source[r] = source[i]
+    return perm
+
+
+class SimplexNoise:
+    def __init__(self, seed: int):
+        self.seed = seed
+        self.perm = _permutation(seed)
+
+    def _contribution(self, xsb, ysb, dx, dy):
+        """
+        Contribution of one lattice vertex to the noise value
+        """
+        perm = self.perm
+        index = perm[(perm[xsb & 0xFF] + ysb) & 0xFF] & 0x0E
+        extrapolation = GRADIENTS2[index] * dx + GRADIENTS2[index + 1] * dy
+        attenuation = np.maximum(2 - dx * dx - dy * dy, 0)
+        attenuation *= attenuation
+        return attenuation * attenuation * extrapolation
+
+    def noise2(self, x, y):
+        """
+        Compute 2D noise for arrays of coordinates
+        Args:
+            x: Array of x coordinates
+            y: Array of y coordinates, broadcast against x
+        Returns:
+            Array of noise values in the broadcast shape of x and y
+        """
+        x, y = np.broadcast_arrays(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+
+        # Place input coordinates onto grid.
+        stretch_offset = (x + y) * STRETCH_CONSTANT2
+        xs = x + stretch_offset
+        ys = y + stretch_offset
+
+        # Floor to get grid coordinates of rhombus (stretched square) super-cell origin.
+        xsb = np.floor(xs).astype(np.int64)
+        ysb = np.floor(ys).astype(np.int64)
+
+        # Skew out to get actual coordinates of rhombus origin.
+        squish_offset = (xsb + ysb) * SQUISH_CONSTANT2
+        xb = xsb + squish_offset
+        yb = ysb + squish_offset
+
+        # Compute grid coordinates relative to rhombus origin.
+        xins = xs - xsb
+        yins = ys - ysb
+        in_sum = xins + yins
+
+        # Positions relative to origin point.
+        dx0 = x - xb
+        dy0 = y - yb
+
+        # Contributions (1,0) and (0,1)
+        value = self._contribution(xsb + 1, ysb + 0, dx0 - 1 - SQUISH_CONSTANT2, dy0 - 0 - SQUISH_CONSTANT2)
+        value += self._contribution(xsb + 0, ysb + 1, dx0 - 0 - SQUISH_CONSTANT2, dy0 - 1 - SQUISH_CONSTANT2)
+
+        # Pick the extra vertex depending on the triangle (2-Simplex) and the closest vertices
+        lower = in_sum <= 1
+        x_greater = xins > yins
+        near_lower = ((1 - in_sum) > xins) | ((1 - in_sum) > yins)
+        near_upper = ((2 - in_sum) < xins) | ((2 - in_sum) < yins)
+        cases = [
+            lower & near_lower & x_greater,
+            lower & near_lower & ~x_greater,
+            lower & ~near_lower,
+            ~lower & near_upper & x_greater,
+            ~lower & near_upper & ~x_greater,
+        ]
+        xsv_ext = np.select(cases, [xsb + 1, xsb - 1, xsb + 1, xsb + 2, xsb + 0], default=xsb)
+        ysv_ext = np.select(cases, [ysb - 1, ysb + 1, ysb + 1, ysb + 0, ysb + 2], default=ysb)
+        dx_ext = np.select(cases, [
+            dx0 - 1, dx0 + 1, dx0 - 1 - 2 * SQUISH_CONSTANT2,
+            dx0 - 2 - 2 * SQUISH_CONSTANT2, dx0 + 0 - 2 * SQUISH_CONSTANT2,
+        ], default=dx0)
+        dy_ext = np.select(cases, [
+            dy0 + 1, dy0 - 1, dy0 - 1 - 2 * SQUISH_CONSTANT2,
+            dy0 + 0 - 2 * SQUISH_CONSTANT2, dy0 - 2 - 2 * SQUISH_CONSTANT2,
+        ], default=dy0)
+
+        # Contribution (0,0) or (1,1)
+        xsb = np.where(lower, xsb, xsb + 1)
+        ysb = np.where(lower, ysb, ysb + 1)
+        dx0 = np.where(lower, dx0, dx0 - 1 - 2 * SQUISH_CONSTANT2)
+        dy0 = np.where(lower, dy0, dy0 - 1 - 2 * SQUISH_CONSTANT2)
+        value += self._contribution(xsb, ysb, dx0, dy0)
+
+        # Extra Vertex
+        value += self._contribution(xsv_ext, ysv_ext, dx_ext, dy_ext)
+
+        return value / NORM_CONSTANT2
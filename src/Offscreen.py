@@ -0,0 +1,80 @@
+import os
+import ctypes
+from OpenGL.GL import *
+
+"""
+This is a class describing an OpenGL context without a window.
+The context comes from Mesa through EGL or OSMesa, whichever PyOpenGL
+was started with (the PYOPENGL_PLATFORM environment variable, it has to be
+set before OpenGL is first imported). Nothing is shown on screen, the
+scene is drawn into a RenderTarget and read back from there.
+It is used to:
+- create an EGL or OSMesa context of a fixed size and make it current
+- destroy the context
+"""
+class OffscreenContext:
+    def __init__(self, width: int, height: int):
+        """
+        Args:
+            width, height: Size of the default framebuffer in pixels
+        """
+        self.width = width
+        self.height = height
+        self.platform = os.environ.get("PYOPENGL_PLATFORM", "")
+        if self.platform == "egl":
+            self._create_egl()
+        elif self.platform == "osmesa":
+            self._create_osmesa()
+        else:
+            raise RuntimeError("Offscreen rendering needs PYOPENGL_PLATFORM set to egl or osmesa "
+                               "before OpenGL is imported")
+
+    def _create_egl(self):
+        # Imported here, the EGL bindings only load with the EGL platform
+        from OpenGL import EGL
+        self.display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        major, minor = EGL.EGLint(), EGL.EGLint()
+        if not EGL.eglInitialize(self.display, ctypes.pointer(major), ctypes.pointer(minor)):
+            raise RuntimeError("Cannot initialize EGL, set EGL_PLATFORM=surfaceless on machines without a display")
+
+        attributes = (EGL.EGLint * 13)(
+            EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+            EGL.EGL_RED_SIZE, 8, EGL.EGL_GREEN_SIZE, 8, EGL.EGL_BLUE_SIZE, 8,
+            EGL.EGL_DEPTH_SIZE, 24,
+            EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+            EGL.EGL_NONE,
+        )
+        config = EGL.EGLConfig()
+        count = EGL.EGLint()
+        if not EGL.eglChooseConfig(self.display, attributes, ctypes.pointer(config), 1, ctypes.pointer(count)) \
+                or count.value == 0:
+            raise RuntimeError("No EGL configuration supports desktop OpenGL")
+
+        size = (EGL.EGLint * 5)(EGL.EGL_WIDTH, self.width, EGL.EGL_HEIGHT, self.height, EGL.EGL_NONE)
+        self.surface = EGL.eglCreatePbufferSurface(self.display, config, size)
+        # Desktop OpenGL with the compatibility profile, the scene shaders need GLSL 3.30
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        self.context = EGL.eglCreateContext(self.display, config, EGL.EGL_NO_CONTEXT, None)
+        if not EGL.eglMakeCurrent(self.display, self.surface, self.surface, self.context):
+            raise RuntimeError("Cannot make the EGL context current")
+
+    def _create_osmesa(self):
+        from OpenGL import osmesa, arrays
+        self.context = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 24, 0, 0, None)
+        if not self.context:
+            raise RuntimeError("Cannot create an OSMesa context")
+        # OSMesa draws the default framebuffer into this array
+        self.buffer = arrays.GLubyteArray.zeros((self.height, self.width, 4))
+        if not osmesa.OSMesaMakeCurrent(self.context, self.buffer, GL_UNSIGNED_BYTE, self.width, self.height):
+            raise RuntimeError("Cannot make the OSMesa context current")
+
+    def close(self):
+        if self.platform == "egl":
+            from OpenGL import EGL
+            EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+            EGL.eglDestroySurface(self.display, self.surface)
+            EGL.eglDestroyContext(self.display, self.context)
+            EGL.eglTerminate(self.display)
+        else:
+            from OpenGL import osmesa
+            osmesa.OSMesaDestroyContext(self.context)
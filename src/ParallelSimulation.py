@@ -0,0 +1,222 @@
+import atexit
+import multiprocessing
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+from src.ParticlePhysics import PhysicsScratch, advance_particles
+
+"""
+This is a class describing the parallel backend of the particle simulation.
+The particle arrays live in shared memory. Every worker process advances
+its own slice of the particles in place, so no particle data is copied
+between processes. The main process only waits for the workers at the end
+of every step and keeps reading the shared arrays for removal, emission
+and drawing.
+It is used to:
+- allocate the particle arrays in shared memory
+- start and stop the worker processes
+- advance the particles on all workers at once
+"""
+
+
+class SharedArrays:
+    """Named NumPy arrays backed by shared memory blocks"""
+
+    def __init__(self):
+        self.blocks = {}
+        self.arrays = {}
+        self._retired = []
+
+    def allocate(self, name: str, shape: tuple, dtype):
+        """
+        Create a new zeroed shared array, replacing the previous array with this name
+        """
+        dtype = np.dtype(dtype)
+        nbytes = max(int(np.prod(shape)) * dtype.itemsize, 1)
+        block = shared_memory.SharedMemory(create=True, size=nbytes)
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        array.fill(0)
+        if name in self.blocks:
+            self._retired.append(self.blocks[name])
+        self.blocks[name] = block
+        self.arrays[name] = array
+        return array
+
+    def layout(self):
+        """Description of the arrays that lets another process attach to them"""
+        return {name: (self.blocks[name].name, array.shape, array.dtype.str)
+                for name, array in self.arrays.items()}
+
+    def release_retired(self):
+        """Free the blocks of replaced arrays"""
+        for block in self._retired:
+            _release(block)
+        self._retired = []
+
+    def close(self):
+        self.release_retired()
+        self.arrays = {}
+        for block in self.blocks.values():
+            _release(block)
+        self.blocks = {}
+
+
+def _release(block):
+    try:
+        block.close()
+    except BufferError:
+        # An array still uses the memory, it is freed when the process exits
+        pass
+    try:
+        block.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _open_block(name: str):
+    """
+    Open an existing block. The main process owns the memory, so the worker
+    does not register it for cleanup where Python allows to skip that (3.13+).
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class _AttachedArrays:
+    """Particle arrays of the main process, seen from a worker"""
+
+    def __init__(self, layout: dict):
+        self.blocks = []
+        for name, (block_name, shape, dtype) in layout.items():
+            block = _open_block(block_name)
+            self.blocks.append(block)
+            setattr(self, name, np.ndarray(shape, dtype=dtype, buffer=block.buf))
+
+    def close(self):
+        for name in list(vars(self)):
+            if name != "blocks":
+                delattr(self, name)
+        for block in self.blocks:
+            block.close()
+
+
+def _worker_main(connection):
+    """
+    Loop of a worker process: attach to the shared arrays and advance
+    the requested slice on every step message
+    """
+    scratch = PhysicsScratch()
+    arrays = None
+    terrain = None
+    while True:
+        message = connection.recv()
+        kind = message[0]
+        if kind == "step":
+            _, start, end, delta_time, settings = message
+            advance_particles(arrays, start, end, delta_time, settings, scratch,
+                              arrays.to_remove, terrain)
+            connection.send(True)
+        elif kind == "attach":
+            if arrays is not None:
+                arrays.close()
+            arrays = _AttachedArrays(message[1])
+            connection.send(True)
+        elif kind == "terrain":
+            terrain = message[1]
+        elif kind == "stop":
+            break
+    if arrays is not None:
+        arrays.close()
+
+
+class ParallelBackend:
+    def __init__(self, workers: int):
+        """
+        Args:
+            workers: Number of worker processes
+        """
+        self.shared = SharedArrays()
+        self.workers = []
+        self.connections = []
+        self.terrain = None
+        self._attached = False
+
+        # fork starts quickly and does not import the main script again;
+        # where it is not available the script must use an `if __name__ == "__main__"` guard
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+        # Start the tracker of shared memory before the workers, so they share it with
+        # this process instead of starting their own one that reports the blocks as leaked
+        if hasattr(resource_tracker, "ensure_running"):
+            resource_tracker.ensure_running()
+        for _ in range(workers):
+            parent, child = context.Pipe()
+            process = context.Process(target=_worker_main, args=(child,), daemon=True)
+            process.start()
+            child.close()
+            self.workers.append(process)
+            self.connections.append(parent)
+        atexit.register(self.close)
+
+    def allocate(self, name: str, shape: tuple, dtype):
+        """
+        Allocator for ParticleStore, creates the arrays in shared memory
+        """
+        self._attached = False
+        return self.shared.allocate(name, shape, dtype)
+
+    def _attach(self):
+        """Send the current array layout to all workers"""
+        layout = self.shared.layout()
+        for connection in self.connections:
+            connection.send(("attach", layout))
+        for connection in self.connections:
+            connection.recv()
+        self.shared.release_retired()
+        self._attached = True
+
+    def set_terrain(self, terrain):
+        """
+        Send the height map to the workers, only when the terrain changes
+        """
+        if terrain is self.terrain:
+            return
+        self.terrain = terrain
+        data = None if terrain is None else (terrain.height_map, terrain.size)
+        for connection in self.connections:
+            connection.send(("terrain", data))
+
+    def step(self, count: int, delta_time: float, settings: dict, terrain=None):
+        """
+        Advance the first count particles, split into one slice per worker,
+        and wait until all workers are done
+        """
+        if not self._attached:
+            self._attach()
+        self.set_terrain(terrain)
+
+        bounds = np.linspace(0, count, len(self.connections) + 1).astype(int)
+        busy = []
+        for connection, start, end in zip(self.connections, bounds[:-1], bounds[1:]):
+            if end > start:
+                connection.send(("step", int(start), int(end), delta_time, settings))
+                busy.append(connection)
+        for connection in busy:
+            connection.recv()
+
+    def close(self):
+        """Stop the workers and free the shared memory"""
+        for connection in self.connections:
+            try:
+                connection.send(("stop",))
+                connection.close()
+            except (OSError, ValueError):
+                pass
+        for process in self.workers:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+        self.connections = []
+        self.workers = []
+        self.shared.close()
@@ -0,0 +1,60 @@
+"""
+This is a class describing the parameters set from the control panel.
+Every value keeps the version in which it last changed, and setting a value
+to what it already is does nothing. The main loop collects the changes once
+per frame, so the storm is updated at most once per frame and only with the
+values that really changed.
+It is used to:
+- keep the current value of every parameter
+- track which parameters changed since the last update
+- coalesce many changes in one frame into a single update
+"""
+class Parameters:
+    def __init__(self, **values):
+        """
+        Args:
+            values: Initial values, they count as changed until the first take_changes
+        """
+        self.values = {}
+        self.versions = {}
+        self.version = 0
+        self.changed = set()
+        self.update(**values)
+
+    def __getitem__(self, name: str):
+        return self.values[name]
+
+    def set(self, name: str, value):
+        """
+        Set a value, it is marked as changed only if it differs from the current one
+        Returns:
+            True if the value changed
+        """
+        if name in self.values and self.values[name] == value:
+            return False
+        self.version += 1
+        self.values[name] = value
+        self.versions[name] = self.version
+        self.changed.add(name)
+        return True
+
+    def update(self, **values):
+        """Set several values at once"""
+        for name, value in values.items():
+            self.set(name, value)
+
+    def changed_since(self, version: int, *names: str):
+        """
+        Whether any of the named values (or any value if no names are given) changed after version
+        """
+        names = names or self.versions.keys()
+        return any(self.versions.get(name, 0) > version for name in names)
+
+    def take_changes(self):
+        """
+        Returns:
+            Dictionary with the values changed since the last call
+        """
+        changes = {name: self.values[name] for name in self.changed}
+        self.changed = set()
+        return changes
@@ -0,0 +1,205 @@
+import numpy as np
+from src.consts import (GROUND_RESTITUTION, GROUND_FRICTION, SETTLE_SPEED,
+                        PARTICLES_PER_CLUSTER, CLUSTER_RADIUS, COLLISION_STIFFNESS)
+from src.HeightMap import sample_height_map
+from src.WindField import sample_wind
+
+"""
+This file contains the physics of the sand particles.
+It works on a range of the particle arrays, so the same code advances the
+whole storm in SandStorm and one slice of it in every parallel worker.
+It is used to:
+- apply the wind field, damping and integration
+- rotate the particles and update their lifetime
+- keep particles above the terrain surface
+- pull nearby particles together and push overlapping ones apart
+- wrap particles around the terrain or mark them for removal
+"""
+
+
+class PhysicsScratch:
+    """Temporary arrays used by advance_particles, one entry per particle"""
+
+    def __init__(self, capacity: int = 0):
+        self.capacity = 0
+        self.reserve(capacity)
+
+    def reserve(self, capacity: int):
+        if capacity <= self.capacity:
+            return
+        self.vector = np.empty((capacity, 3))
+        self.vector_2 = np.empty((capacity, 3))
+        self.scalar = np.empty(capacity)
+        self.step = np.empty(capacity)
+        self.checked = np.empty(capacity, dtype=bool)
+        self.outside = np.empty(capacity, dtype=bool)
+        self.wrap = np.empty(capacity, dtype=bool)
+        self.capacity = capacity
+
+
+def advance_particles(particles, start: int, end: int, delta_time: float, settings: dict,
+                      scratch: PhysicsScratch, to_remove: np.ndarray, terrain=None):
+    """
+    Advance the particles in [start, end) by one time step
+    Args:
+        particles: Object with the particle arrays (ParticleStore or shared arrays)
+        start, end: Range of particles to advance
+        delta_time: Time step
+        settings: Dictionary with wind_field (WindField.state()), particle_mass,
+            center (array of 3) and half_terrain
+        scratch: Temporary arrays with room for end - start particles
+        to_remove: Boolean array, entries [start, end) are set to True for particles to remove
+        terrain: Optional (height_map, size) tuple used for collision
+    """
+    count = end - start
+    if count <= 0:
+        return
+    scratch.reserve(count)
+    live = slice(start, end)
+
+    # Views of the particles and of the scratch arrays, nothing is allocated here
+    position = particles.position[live]
+    velocity = particles.velocity[live]
+    mass = particles.mass[live]
+    active = particles.active[live]
+    wrapped = particles.wrapped[live]
+    force = scratch.vector[:count]
+    vector = scratch.vector_2[:count]
+    scalar = scratch.scalar[:count]
+    remove = to_remove[live]
+
+    # Inactive particles keep their state, so they move with a zero time step
+    step = np.multiply(active, delta_time, out=scratch.step[:count])[:, None]
+
+    # Wind with gusts at the particle positions
+    sample_wind(settings["wind_field"], position, out=force)
+    force[:, 0] *= 4.0
+
+    # Mass depends on the particle size
+    np.sqrt(particles.size[live], out=mass)
+    mass *= settings["particle_mass"] * 2
+
+    # Update velocity with damping
+    force /= mass[:, None]
+    force *= step
+    velocity += force
+    np.multiply(velocity, 0.98, out=velocity, where=active[:, None])
+
+    # Update position, rotations and lifetime
+    position += np.multiply(velocity, step, out=vector)
+    np.multiply(particles.rotation_speed[live], step, out=vector)
+    vector *= 15
+    particles.rotation[live] += vector
+    particles.lifetime[live] += step[:, 0]
+
+    # Keep particles above the dunes
+    if terrain is not None:
+        collide_with_terrain(position, velocity, particles.size[live], active, *terrain)
+
+    # Check if particle is too far vertically
+    center = settings["center"]
+    half_terrain = settings["half_terrain"]
+    distance = scalar
+    np.subtract(position[:, 1], center[1], out=distance)
+    np.abs(distance, out=distance)
+    np.greater(distance, half_terrain, out=remove)
+    remove &= active
+    checked = np.logical_not(remove, out=scratch.checked[:count])
+    checked &= active
+
+    # Handle horizontal wrapping (X and Z coordinates)
+    outside = scratch.outside[:count]
+    wrap = scratch.wrap[:count]
+    for axis in (0, 2):
+        np.subtract(position[:, axis], center[axis], out=distance)
+        np.abs(distance, out=distance)
+        np.greater(distance, half_terrain, out=outside)
+        outside &= checked
+        # If particle has already wrapped once, remove it
+        remove |= np.logical_and(outside, wrapped, out=wrap)
+        # Otherwise wrap it to the opposite side of the center
+        np.logical_not(wrapped, out=wrap)
+        wrap &= outside
+        np.subtract(2 * center[axis], position[:, axis], out=position[:, axis], where=wrap)
+        wrapped |= wrap
+
+
+def collide_with_terrain(position, velocity, size, active, height_map, terrain_size):
+    """
+    Push particles that went below the terrain back onto its surface.
+    Depending on their speed they bounce, slide along the slope or settle.
+    Args:
+        position, velocity, size, active: Arrays of the particles to check
+        height_map: Height map of the terrain
+        terrain_size: Size of the terrain
+    """
+    ground = sample_height_map(height_map, terrain_size, position[:, 0], position[:, 2], with_normals=False)[0]
+    ground += size
+    hit = np.flatnonzero(active & (position[:, 1] < ground))
+    if len(hit) == 0:
+        return
+
+    position[hit, 1] = ground[hit]
+    _, normal = sample_height_map(height_map, terrain_size, position[hit, 0], position[hit, 2])
+    hit_velocity = velocity[hit]
+    normal_speed = np.einsum("ij,ij->i", hit_velocity, normal)
+    tangent = hit_velocity - normal_speed[:, None] * normal
+
+    # Bounce: the part moving into the ground is reflected and loses energy
+    normal_speed = np.where(normal_speed < 0, -normal_speed * GROUND_RESTITUTION, normal_speed)
+    # Slide: friction slows down the motion along the surface
+    hit_velocity = tangent * (1 - GROUND_FRICTION) + normal_speed[:, None] * normal
+    # Settle: slow particles come to rest on the ground
+    hit_velocity[np.einsum("ij,ij->i", hit_velocity, hit_velocity) < SETTLE_SPEED ** 2] = 0
+    velocity[hit] = hit_velocity
+
+
+def interact_particles(particles, count: int, grid, delta_time: float, strength: float,
+                       radius: float = CLUSTER_RADIUS):
+    """
+    Cohesion and collision between particles closer than radius.
+    Pairs are pulled together, weaker the further apart they are, and pushed
+    apart when they overlap. A particle with more neighbors than fit into one
+    cluster (PARTICLES_PER_CLUSTER) shares the pull between them, so dense
+    clumps do not collapse.
+    Args:
+        particles: Object with the particle arrays
+        count: Number of live particles
+        grid: SpatialHash with a cell size of at least radius, rebuilt here
+        delta_time: Time step
+        strength: Cohesion strength
+        radius: Interaction radius
+    Returns:
+        (first, second) index arrays of the interacting pairs
+    """
+    position = particles.position[:count]
+    grid.build(position)
+    first, second = grid.pairs(radius)
+    active = particles.active[:count]
+    both_active = active[first] & active[second]
+    first, second = first[both_active], second[both_active]
+    if len(first) == 0:
+        return first, second
+
+    delta = np.take(position, second, axis=0)
+    delta -= np.take(position, first, axis=0)
+    distance = np.sqrt(np.einsum("ij,ij->i", delta, delta))
+    direction = delta / np.maximum(distance, 1e-9)[:, None]
+
+    # Pull from the contact distance to the radius, push when the particles overlap
+    size = particles.size[:count]
+    contact = size[first] + size[second]
+    pull = np.where(distance < contact,
+                    (distance - contact) * COLLISION_STIFFNESS,
+                    strength * (1 - distance / radius))
+    impulse = direction * (pull * delta_time)[:, None]
+
+    neighbors = np.bincount(first, minlength=count) + np.bincount(second, minlength=count)
+    limit = PARTICLES_PER_CLUSTER - 1
+    share = limit / np.maximum(neighbors, limit) / particles.mass[:count]
+    velocity = particles.velocity[:count]
+    for axis in range(3):
+        change = (np.bincount(first, impulse[:, axis], minlength=count)
+                  - np.bincount(second, impulse[:, axis], minlength=count))
+        velocity[:, axis] += change * share
+    return first, second
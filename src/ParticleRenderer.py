@@ -0,0 +1,363 @@
+import ctypes
+import numpy as np
+from OpenGL.GL import *
+from src.Shaders import get_program
+from src.SceneUniforms import SCENE_BLOCK, SCENE_BINDING
+from src.Lighting import LIGHTING
+from src.consts import LOD_MESH_DISTANCE, LOD_BILLBOARD_DISTANCE
+
+"""
+This is a class describing the renderer of the sand particles.
+Particles are drawn with a level of detail chosen by their distance from
+the camera: near particles are instances of one shared low-poly sphere,
+particles at medium range are camera-facing quads shaded like a sphere,
+and far particles, which cover only a few pixels, are point sprites.
+Every level is drawn with one instanced draw call. The particles are
+blended, so they are sorted from back to front by their distance from the
+camera before they are uploaded.
+It is used to:
+- build the shared sphere mesh
+- choose the level of detail of every particle in one pass over the arrays
+- order the particles from back to front for alpha blending
+- upload the translation, rotation, scale and color of every particle into an instance buffer
+- draw all particles at once
+"""
+
+# Tessellation of the shared sphere (same as the old gluSphere(..., 6, 6))
+SPHERE_SLICES = 6
+SPHERE_STACKS = 6
+
+# Floats per instance: translation (3), scale (1), rotation (3), color (4)
+INSTANCE_FLOATS = 11
+
+# Levels of detail, from the nearest to the farthest
+MESH, BILLBOARD, POINT = range(3)
+LEVEL_COUNT = 3
+
+# Precision of the depth keys. While the camera moves the order is only
+# sorted into 256 depth buckets, a single cheaper pass; small ordering
+# errors are not visible in motion.
+SORT_BITS_STILL = 16
+SORT_BITS_MOVING = 8
+
+VERTEX_SHADER = """
+#version 330
+""" + SCENE_BLOCK + LIGHTING + """
+in vec3 vertex;
+in vec4 offset_scale;
+in vec3 rotation;
+in vec4 color;
+out vec4 particle_color;
+
+mat3 rotate_x(float a) { float c = cos(a); float s = sin(a); return mat3(1.0, 0.0, 0.0, 0.0, c, s, 0.0, -s, c); }
+mat3 rotate_y(float a) { float c = cos(a); float s = sin(a); return mat3(c, 0.0, -s, 0.0, 1.0, 0.0, s, 0.0, c); }
+mat3 rotate_z(float a) { float c = cos(a); float s = sin(a); return mat3(c, s, 0.0, -s, c, 0.0, 0.0, 0.0, 1.0); }
+
+void main() {
+    // Same order as glRotatef around X, then Y, then Z
+    vec3 angles = radians(rotation);
+    mat3 rotation_matrix = rotate_x(angles.x) * rotate_y(angles.y) * rotate_z(angles.z);
+    vec3 world = rotation_matrix * (vertex * offset_scale.w) + offset_scale.xyz;
+    vec4 eye = view * vec4(world, 1.0);
+    gl_Position = projection * eye;
+
+    // The view has no scaling, so it turns normals like positions
+    vec3 normal = normalize(mat3(view) * (rotation_matrix * vertex));
+    particle_color = vec4(light_color(color.rgb, normal, eye.xyz), color.a);
+}
+"""
+
+FRAGMENT_SHADER = """
+#version 330
+in vec4 particle_color;
+out vec4 fragment_color;
+
+void main() {
+    fragment_color = particle_color;
+}
+"""
+
+# Billboards and point sprites are shaded per fragment as if they were spheres
+IMPOSTOR_FRAGMENT = """
+#version 330
+""" + SCENE_BLOCK + LIGHTING + """
+in vec4 sphere_color;
+in vec3 eye_center;
+in float eye_radius;
+out vec4 fragment_color;
+
+void shade(vec2 corner) {
+    float distance_squared = dot(corner, corner);
+    if (distance_squared > 1.0) {
+        discard;
+    }
+    vec3 normal = vec3(corner, sqrt(1.0 - distance_squared));
+    vec3 eye = eye_center + normal * eye_radius;
+    fragment_color = vec4(light_color(sphere_color.rgb, normal, eye), sphere_color.a);
+}
+"""
+
+BILLBOARD_VERTEX_SHADER = """
+#version 330
+""" + SCENE_BLOCK + """
+in vec3 vertex;
+in vec4 offset_scale;
+in vec4 color;
+out vec4 sphere_color;
+out vec3 eye_center;
+out float eye_radius;
+out vec2 corner;
+
+void main() {
+    // Quad facing the camera, as large as the sphere
+    vec4 center = view * vec4(offset_scale.xyz, 1.0);
+    gl_Position = projection * (center + vec4(vertex.xy * offset_scale.w, 0.0, 0.0));
+    corner = vertex.xy;
+    sphere_color = color;
+    eye_center = center.xyz;
+    eye_radius = offset_scale.w;
+}
+"""
+
+BILLBOARD_FRAGMENT_SHADER = IMPOSTOR_FRAGMENT + """
+in vec2 corner;
+
+void main() {
+    shade(corner);
+}
+"""
+
+POINT_VERTEX_SHADER = """
+#version 330
+""" + SCENE_BLOCK + """
+in vec4 offset_scale;
+in vec4 color;
+out vec4 sphere_color;
+out vec3 eye_center;
+out float eye_radius;
+
+void main() {
+    vec4 center = view * vec4(offset_scale.xyz, 1.0);
+    gl_Position = projection * center;
+    // Diameter of the sphere on the screen in pixels, at least one pixel
+    gl_PointSize = max(offset_scale.w * projection[1][1] * viewport.w / -center.z, 1.0);
+    sphere_color = color;
+    eye_center = center.xyz;
+    eye_radius = offset_scale.w;
+}
+"""
+
+POINT_FRAGMENT_SHADER = IMPOSTOR_FRAGMENT + """
+void main() {
+    // gl_PointCoord goes down the screen, the corner goes up
+    shade(vec2(gl_PointCoord.x * 2.0 - 1.0, 1.0 - gl_PointCoord.y * 2.0));
+}
+"""
+
+
+def build_sphere(slices: int, stacks: int):
+    """
+    Build a unit sphere as vertices and triangle indices
+    Args:
+        slices: Number of subdivisions around the Z axis
+        stacks: Number of subdivisions along the Z axis
+    """
+    phi = np.linspace(0, np.pi, stacks + 1)[:, None]
+    theta = np.linspace(0, 2 * np.pi, slices + 1)[None, :]
+    vertices = np.stack((
+        np.sin(phi) * np.cos(theta),
+        np.sin(phi) * np.sin(theta),
+        np.cos(phi) * np.ones_like(theta),
+    ), axis=-1).reshape(-1, 3).astype(np.float32)
+
+    # Two triangles for every quad between neighbouring stacks and slices
+    row = np.arange(stacks)[:, None] * (slices + 1)
+    column = np.arange(slices)[None, :]
+    v0 = (row + column).ravel()
+    v1 = v0 + 1
+    v2 = v0 + slices + 1
+    v3 = v2 + 1
+    indices = np.stack((v0, v2, v1, v1, v2, v3), axis=-1).ravel().astype(np.uint32)
+    return vertices, indices
+
+
+def depth_order(positions: np.ndarray, eye, distances, bits: int = 16):
+    """
+    Back-to-front order of the particles and their level of detail.
+    The distances from the camera are quantized to integer keys and sorted with
+    a stable sort, which NumPy does as a radix sort for keys of up to 16 bits.
+    The levels are chosen from the same keys, so in the sorted order every
+    level is one contiguous range: point sprites, then billboards, then meshes.
+    Args:
+        positions: Array of shape (N, 3)
+        eye: Position of the camera
+        distances: Largest distance of the mesh and of the billboard level
+        bits: Precision of the keys, 8 or 16
+    Returns:
+        (order, level_counts) with order the indices from the farthest to the
+        nearest particle and level_counts the number of particles of every level
+    """
+    delta = positions - np.asarray(eye, dtype=positions.dtype)
+    distance = np.sqrt(np.einsum("ij,ij->i", delta, delta))
+    far = max(float(distance.max(initial=0.0)), max(distances), 1e-6)
+    # The farthest particle gets key 0
+    scale = ((1 << bits) - 1) / far
+    distance = far - distance
+    distance *= scale
+    keys = distance.astype(np.uint8 if bits <= 8 else np.uint16)
+    order = np.argsort(keys, kind="stable")
+
+    # Keys where the billboards and the meshes begin
+    band_keys = (far - np.asarray(distances[::-1], dtype=np.float64)) * scale
+    boundaries = np.searchsorted(keys[order], band_keys, side="right")
+    level_counts = np.diff(np.concatenate(([0], boundaries, [len(keys)])))[::-1]
+    return order, level_counts
+
+
+class ParticleRenderer:
+    def __init__(self, lod_distances=(LOD_MESH_DISTANCE, LOD_BILLBOARD_DISTANCE)):
+        """
+        Args:
+            lod_distances: Distances from the camera up to which particles are drawn
+                as meshes and as billboards, farther particles are point sprites
+        """
+        self.lod_distances = lod_distances
+        self.instance_capacity = 0
+        # Particles drawn with every level of detail in the last draw
+        self.level_counts = np.zeros(LEVEL_COUNT, dtype=np.int64)
+        # Camera position of the last draw, to tell whether the camera moves
+        self.last_eye = None
+
+        # Per-particle data, shared by all levels
+        self.instance_vbo = glGenBuffers(1)
+
+        # Camera, light and viewport come from the scene uniform buffer
+        attributes = ("vertex", "offset_scale", "rotation", "color")
+        blocks = {"Scene": SCENE_BINDING}
+        self.programs = [
+            get_program(VERTEX_SHADER, FRAGMENT_SHADER, attributes, blocks),
+            get_program(BILLBOARD_VERTEX_SHADER, BILLBOARD_FRAGMENT_SHADER, attributes, blocks),
+            get_program(POINT_VERTEX_SHADER, POINT_FRAGMENT_SHADER, attributes, blocks),
+        ]
+
+        # Shape of every level: (vertices, indices or None, primitive)
+        sphere_vertices, sphere_indices = build_sphere(SPHERE_SLICES, SPHERE_STACKS)
+        corners = np.array([(-1, -1, 0), (1, -1, 0), (1, 1, 0), (-1, 1, 0)], dtype=np.float32)
+        shapes = [
+            (sphere_vertices, sphere_indices, GL_TRIANGLES),
+            (corners, np.array([0, 1, 2, 0, 2, 3], dtype=np.uint32), GL_TRIANGLES),
+            (np.zeros((1, 3), dtype=np.float32), None, GL_POINTS),
+        ]
+        self.vaos = []
+        self.shapes = []
+        for vertices, indices, primitive in shapes:
+            vao = glGenVertexArrays(1)
+            glBindVertexArray(vao)
+
+            vbo = glGenBuffers(1)
+            glBindBuffer(GL_ARRAY_BUFFER, vbo)
+            glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+            glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 0, None)
+            glEnableVertexAttribArray(0)
+
+            if indices is not None:
+                ibo = glGenBuffers(1)
+                glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, ibo)
+                glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
+
+            # Instance attributes, advanced once per instance
+            for location in (1, 2, 3):
+                glVertexAttribDivisor(location, 1)
+                glEnableVertexAttribArray(location)
+            self.vaos.append(vao)
+            self.shapes.append((primitive, len(indices) if indices is not None else len(vertices), indices is not None))
+
+            glBindVertexArray(0)
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        self.instances = np.zeros((0, INSTANCE_FLOATS), dtype=np.float32)
+
+    def upload(self, positions, sizes, rotations, colors, order=None):
+        """
+        Pack the particle attributes into the instance buffer
+        Args:
+            positions: Array of shape (N, 3)
+            sizes: Array of shape (N,)
+            rotations: Array of shape (N, 3) with rotations in degrees
+            colors: Array of shape (N, 4) with RGBA colors
+            order: Optional order of the particles in the buffer
+        """
+        count = len(sizes)
+        if len(self.instances) < count:
+            self.instances = np.zeros((count, INSTANCE_FLOATS), dtype=np.float32)
+        instances = self.instances[:count]
+        instances[:, 0:3] = positions
+        instances[:, 3] = sizes
+        instances[:, 4:7] = rotations
+        instances[:, 7:11] = colors
+        if order is not None:
+            instances[:] = np.take(instances, order, axis=0)
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.instance_vbo)
+        if count > self.instance_capacity:
+            self.instance_capacity = len(self.instances)
+            glBufferData(GL_ARRAY_BUFFER, self.instances.nbytes, None, GL_STREAM_DRAW)
+        if count > 0:
+            glBufferSubData(GL_ARRAY_BUFFER, 0, instances.nbytes, instances)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def _bind_instances(self, first: int):
+        """Point the instance attributes of the bound vertex array at the instances from first on"""
+        glBindBuffer(GL_ARRAY_BUFFER, self.instance_vbo)
+        stride = INSTANCE_FLOATS * 4
+        for location, (components, offset) in enumerate(((4, 0), (3, 4), (4, 7)), start=1):
+            glVertexAttribPointer(location, components, GL_FLOAT, GL_FALSE, stride,
+                                  ctypes.c_void_p((first * INSTANCE_FLOATS + offset) * 4))
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def draw(self, positions, sizes, rotations, colors, eye=None):
+        """
+        Draw all given particles from back to front, with one instanced draw call per level of detail
+        Args:
+            eye: Position of the camera. Without it all particles are drawn
+                as meshes in the given order.
+        """
+        if eye is None:
+            order = None
+            self.level_counts = np.array([len(sizes), 0, 0])
+        else:
+            eye = np.asarray(eye, dtype=np.float64)
+            moving = self.last_eye is not None and not np.array_equal(eye, self.last_eye)
+            self.last_eye = eye
+            order, self.level_counts = depth_order(positions, eye, self.lod_distances,
+                                                   SORT_BITS_MOVING if moving else SORT_BITS_STILL)
+        self.upload(positions, sizes, rotations, colors, order)
+        if self.level_counts.sum() == 0:
+            return
+
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        glEnable(GL_VERTEX_PROGRAM_POINT_SIZE)
+        glEnable(GL_POINT_SPRITE)
+
+        # The buffer holds the farthest level first
+        first = 0
+        for level in reversed(range(LEVEL_COUNT)):
+            count = int(self.level_counts[level])
+            if count == 0:
+                continue
+            glUseProgram(self.programs[level])
+            glBindVertexArray(self.vaos[level])
+            self._bind_instances(first)
+            primitive, element_count, indexed = self.shapes[level]
+            if indexed:
+                glDrawElementsInstanced(primitive, element_count, GL_UNSIGNED_INT, None, count)
+            else:
+                glDrawArraysInstanced(primitive, 0, element_count, count)
+            glBindVertexArray(0)
+            first += count
+
+        glDisable(GL_POINT_SPRITE)
+        glDisable(GL_VERTEX_PROGRAM_POINT_SIZE)
+        glDisable(GL_BLEND)
+        glUseProgram(0)
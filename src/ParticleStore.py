@@ -0,0 +1,160 @@
+import numpy as np
+
+"""
+This is a class describing the store of sand particles.
+Every attribute of the particles is kept in its own NumPy array
+(structure of arrays), so the whole storm can be updated in a few
+vectorized passes instead of a Python loop over particle objects.
+The arrays are preallocated for a fixed capacity and the live particles
+are always the first count entries. New particles take the free slots at
+the end and removed particles are replaced by the last live ones
+(swap with last), so spawning and removing particles does not allocate
+new arrays.
+It is used to:
+- keep the position, previous position, velocity, size, mass, color,
+  rotation, rotation speed, lifetime, wrapped flag and active flag of every particle
+- add new particles with random size, color and rotation
+- remove particles selected by a mask
+"""
+class ParticleStore:
+    # Names of all per-particle arrays with their shape after the particle axis and their type
+    ATTRIBUTES = {
+        "position": ((3,), np.float64),
+        "previous_position": ((3,), np.float64),  # Position before the last update, for drawing between updates
+        "velocity": ((3,), np.float64),
+        "size": ((), np.float64),
+        "mass": ((), np.float64),
+        "color": ((4,), np.float64),
+        "rotation": ((3,), np.float64),        # Rotation around X, Y and Z in degrees
+        "rotation_speed": ((3,), np.float64),
+        "lifetime": ((), np.float64),
+        "wrapped": ((), np.bool_),             # Whether the particle has already wrapped around the terrain
+        "active": ((), np.bool_),              # Whether the particle is still active in the simulation
+    }
+
+    def __init__(self, capacity: int = 0, rng=None, allocator=None):
+        """
+        Args:
+            capacity: Number of particles the arrays have room for
+            rng: NumPy random generator used for new particles
+            allocator: Optional function (name, shape, dtype) returning a zeroed array,
+                used to place the arrays in shared memory. Defaults to np.zeros.
+        """
+        self.count = 0
+        self.capacity = 0
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.allocator = allocator
+        for name, (shape, dtype) in self.ATTRIBUTES.items():
+            setattr(self, name, np.zeros((0,) + shape, dtype=dtype))
+        self.reserve(capacity)
+
+    def __len__(self):
+        return self.count
+
+    def reserve(self, capacity: int):
+        """
+        Make room for at least capacity particles. This allocates new arrays,
+        so it should only happen when the maximum number of particles grows.
+        """
+        if capacity <= self.capacity:
+            return
+        for name, (shape, dtype) in self.ATTRIBUTES.items():
+            if self.allocator is not None:
+                array = self.allocator(name, (capacity,) + shape, dtype)
+            else:
+                array = np.zeros((capacity,) + shape, dtype=dtype)
+            array[:self.count] = getattr(self, name)[:self.count]
+            setattr(self, name, array)
+
+        # Scratch buffers used when adding and removing particles
+        self._random = np.empty(capacity)
+        self._indices = np.arange(capacity)
+        self._holes = np.empty(capacity, dtype=np.int64)
+        self._sources = np.empty(capacity, dtype=np.int64)
+        self._keep = np.empty(capacity, dtype=bool)
+        self._moved = {name: np.empty((capacity,) + shape, dtype=dtype)
+                       for name, (shape, dtype) in self.ATTRIBUTES.items()}
+        self.capacity = capacity
+
+    def add(self, count: int, size: float):
+        """
+        Take free slots for new particles with random size, color and rotation
+        Args:
+            count: Number of particles to add, limited by the free capacity
+            size: Base size of the particles
+        Returns:
+            Slice of the new particles, their positions are set to zero
+        """
+        start = self.count
+        end = min(start + count, self.capacity)
+        new = slice(start, end)
+        count = end - start
+        rng = self.rng
+
+        self.position[new] = 0
+        self.previous_position[new] = 0
+        self.velocity[new] = 0
+        self.mass[new] = 1
+        self.lifetime[new] = 0
+        self.wrapped[new] = False
+        self.active[new] = True
+
+        # random size: size * uniform(3, 10)
+        rng.random(out=self.size[new])
+        self.size[new] *= 7 * size
+        self.size[new] += 3 * size
+
+        # random color: (1.0, uniform(0.4, 0.78), 0.26, uniform(0.7, 1.0))
+        color = self.color[new]
+        color[:, 0] = 1.0
+        color[:, 2] = 0.26
+        random = self._random[:count]
+        for channel, low, high in ((1, 0.4, 0.78), (3, 0.7, 1.0)):
+            rng.random(out=random)
+            np.multiply(random, high - low, out=color[:, channel])
+            color[:, channel] += low
+
+        # random rotation: uniform(0, 360) and speed uniform(-5, 5)
+        rng.random(out=self.rotation[new])
+        self.rotation[new] *= 360
+        rng.random(out=self.rotation_speed[new])
+        self.rotation_speed[new] *= 10
+        self.rotation_speed[new] -= 5
+
+        self.count = end
+        return new
+
+    def remove(self, mask: np.ndarray):
+        """
+        Remove the particles selected by the mask. Every removed particle
+        that is not at the end is replaced by one of the last live particles.
+        Args:
+            mask: Boolean array of length count, True for every particle to remove
+        """
+        count = self.count
+        removed = int(np.count_nonzero(mask))
+        if removed == 0:
+            return
+        new_count = count - removed
+
+        # Holes: removed particles before the new end
+        # Sources: live particles after the new end, moved into the holes
+        moves = int(np.count_nonzero(mask[:new_count]))
+        holes = np.compress(mask[:new_count], self._indices[:new_count], out=self._holes[:moves])
+        keep = np.logical_not(mask[new_count:count], out=self._keep[:removed])
+        sources = np.compress(keep, self._indices[new_count:count], out=self._sources[:moves])
+
+        for name in self.ATTRIBUTES:
+            array = getattr(self, name)
+            moved = np.take(array, sources, axis=0, out=self._moved[name][:moves])
+            array[holes] = moved
+        self.count = new_count
+
+    def truncate(self, count: int):
+        """
+        Keep only the first count particles
+        """
+        self.count = max(0, min(self.count, count))
+
+    def clear(self):
+        self.truncate(0)
@@ -0,0 +1,160 @@
+import json
+import time
+from contextlib import contextmanager
+import numpy as np
+from src.consts import PROFILER_FRAMES
+
+"""
+This is a class describing the frame profiler.
+The time of every stage of the last frames is kept in a fixed-size ring
+buffer, so recording a frame never allocates memory and old frames are
+simply overwritten. OpenGL draws asynchronously, so the draw stages
+measure the time spent submitting commands; waiting for the GPU shows up
+in the stage that swaps the buffers.
+It is used to:
+- measure the time of the stages of a frame
+- compute the average and 99th percentile time of every stage
+- export the recorded frames to JSON or to the Chrome trace format
+"""
+class FrameProfiler:
+    def __init__(self, stages, capacity: int = PROFILER_FRAMES):
+        """
+        Args:
+            stages: Names of the stages, in the order they run in a frame
+            capacity: Number of frames kept in the ring buffer
+        """
+        self.stages = list(stages)
+        self.stage_index = {name: index for index, name in enumerate(self.stages)}
+        self.capacity = capacity
+        # Seconds since the profiler was created, one row per frame
+        self.frame_starts = np.zeros(capacity)
+        self.frame_ends = np.zeros(capacity)
+        self.stage_starts = np.zeros((capacity, len(self.stages)))
+        self.durations = np.zeros((capacity, len(self.stages)))
+        self.frame_count = 0
+        self.origin = time.perf_counter()
+
+    def _row(self):
+        return self.frame_count % self.capacity
+
+    def begin_frame(self):
+        row = self._row()
+        self.frame_starts[row] = time.perf_counter() - self.origin
+        self.stage_starts[row] = 0
+        self.durations[row] = 0
+
+    def end_frame(self):
+        self.frame_ends[self._row()] = time.perf_counter() - self.origin
+        self.frame_count += 1
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Measure the code inside a with block as the given stage of the current frame
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter())
+
+    def record(self, name: str, start: float, end: float):
+        """
+        Add a measured stage to the current frame. A stage that runs more
+        than once in a frame adds up its times and keeps its first start.
+        Args:
+            name: Name of the stage
+            start, end: time.perf_counter() values at the start and end of the stage
+        """
+        row = self._row()
+        index = self.stage_index[name]
+        if self.durations[row, index] == 0:
+            self.stage_starts[row, index] = start - self.origin
+        self.durations[row, index] += end - start
+
+    def frames(self):
+        """
+        Rows of the recorded frames, from the oldest to the newest
+        """
+        if self.frame_count <= self.capacity:
+            return np.arange(self.frame_count)
+        return (np.arange(self.capacity) + self._row()) % self.capacity
+
+    def recent(self, count: int):
+        """
+        Times of the last frames, from the oldest to the newest
+        Returns:
+            (frame durations, stage durations) arrays of shapes (N,) and (N, stages) in milliseconds
+        """
+        rows = self.frames()[-count:]
+        return (self.frame_ends[rows] - self.frame_starts[rows]) * 1000, self.durations[rows] * 1000
+
+    def statistics(self):
+        """
+        Returns:
+            Dictionary stage name -> (average, 99th percentile) time in milliseconds
+        """
+        rows = self.frames()
+        if len(rows) == 0:
+            return {name: (0.0, 0.0) for name in self.stages}
+        durations = self.durations[rows] * 1000
+        averages = durations.mean(axis=0)
+        percentiles = np.percentile(durations, 99, axis=0)
+        return {name: (float(averages[index]), float(percentiles[index]))
+                for index, name in enumerate(self.stages)}
+
+    def to_dict(self):
+        """
+        Recorded frames as plain Python data, times in milliseconds
+        """
+        rows = self.frames()
+        return {
+            "stages": self.stages,
+            "statistics": {name: {"average": average, "p99": p99}
+                           for name, (average, p99) in self.statistics().items()},
+            "frames": [
+                {
+                    "start": self.frame_starts[row] * 1000,
+                    "duration": (self.frame_ends[row] - self.frame_starts[row]) * 1000,
+                    "stages": dict(zip(self.stages, (self.durations[row] * 1000).tolist())),
+                }
+                for row in rows
+            ],
+        }
+
+    def to_chrome_trace(self):
+        """
+        Recorded frames as Chrome trace events (chrome://tracing, Perfetto).
+        Every frame and every stage becomes a complete event, times in microseconds.
+        """
+        events = []
+        for row in self.frames():
+            events.append({
+                "name": "frame", "cat": "frame", "ph": "X", "pid": 0, "tid": 0,
+                "ts": self.frame_starts[row] * 1e6,
+                "dur": (self.frame_ends[row] - self.frame_starts[row]) * 1e6,
+            })
+            for index, name in enumerate(self.stages):
+                if self.durations[row, index] > 0:
+                    events.append({
+                        "name": name, "cat": "stage", "ph": "X", "pid": 0, "tid": 0,
+                        "ts": self.stage_starts[row, index] * 1e6,
+                        "dur": self.durations[row, index] * 1e6,
+                    })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export(self, path: str, format: str = "chrome"):
+        """
+        Write the recorded frames to a file
+        Args:
+            path: Path of the output file
+            format: "chrome" for the Chrome trace format or "json" for frames and statistics
+        """
+        if format == "chrome":
+            data = self.to_chrome_trace()
+        elif format == "json":
+            data = self.to_dict()
+        else:
+            raise ValueError(f"Unknown trace format: {format}")
+        with open(path, "w") as file:
+            json.dump(data, file)
@@ -0,0 +1,80 @@
+import numpy as np
+from src.consts import *
+
+# Stages of the frame every quality scale makes cheaper
+KNOB_STAGES = {
+    "particles": ("storm update", "storm draw"),
+    "emission": ("storm update",),
+    "lod": ("storm draw",),
+}
+
+"""
+This is a class describing the adaptive quality controller.
+After every QUALITY_INTERVAL frames it compares the median frame time
+from the profiler with the target, so single hitches do not count as
+load. When the frames are too slow, the scales tied to the most expensive
+stage are cut in proportion to the overrun, and when there is enough
+headroom all scales grow back slowly.
+The band between the two thresholds keeps the quality from oscillating.
+Every scale stays within its bounds, 1.0 is the full quality.
+It is used to:
+- measure the recent frame and stage times
+- lower or raise the particle cap, emission and level of detail scales
+- describe what it changed
+"""
+class QualityController:
+    def __init__(self, target_frame_time: float, bounds=QUALITY_BOUNDS, interval: int = QUALITY_INTERVAL):
+        """
+        Args:
+            target_frame_time: Frame time to hold in milliseconds
+            bounds: Dictionary scale name -> (lowest, highest) value
+            interval: Number of frames measured between two adjustments
+        """
+        self.target_frame_time = target_frame_time
+        self.bounds = dict(bounds)
+        self.interval = interval
+        self.scales = {name: high for name, (low, high) in self.bounds.items()}
+        # Median frame time of the last adjustment window
+        self.frame_time = 0.0
+        self.last_adjustment = 0
+
+    def update(self, profiler):
+        """
+        Adjust the scales, call once per frame after profiler.end_frame
+        Args:
+            profiler: FrameProfiler with the stages named in KNOB_STAGES
+        Returns:
+            Dictionary with the scales changed in this frame
+        """
+        # Only frames measured after the last adjustment count
+        if profiler.frame_count - self.last_adjustment < self.interval:
+            return {}
+        self.last_adjustment = profiler.frame_count
+        frame_times, stage_times = profiler.recent(self.interval)
+        self.frame_time = float(np.median(frame_times))
+
+        if self.frame_time > self.target_frame_time * (1 + QUALITY_TOLERANCE):
+            stage_medians = dict(zip(profiler.stages, np.median(stage_times, axis=0)))
+            busiest = max({stage for stages in KNOB_STAGES.values() for stage in stages},
+                          key=lambda stage: stage_medians.get(stage, 0.0))
+            # The cost of the stages falls roughly in proportion to the scales
+            factor = max(self.target_frame_time / self.frame_time, QUALITY_MAX_CUT)
+            names = [name for name in self.scales if busiest in KNOB_STAGES[name]]
+        elif self.frame_time < self.target_frame_time * (1 - QUALITY_HEADROOM):
+            factor = QUALITY_RECOVERY
+            names = list(self.scales)
+        else:
+            return {}
+
+        changes = {}
+        for name in names:
+            low, high = self.bounds[name]
+            scale = float(np.clip(self.scales[name] * factor, low, high))
+            if scale != self.scales[name]:
+                self.scales[name] = changes[name] = scale
+        return changes
+
+    def describe(self, changes):
+        """One line about the changed scales, for the console"""
+        scales = ", ".join(f"{name} {scale:.0%}" for name, scale in changes.items())
+        return f"Quality: {scales} (frame {self.frame_time:.1f} ms, target {self.target_frame_time:.1f} ms)"
@@ -0,0 +1,41 @@
+import zlib
+import numpy as np
+
+"""
+This is a class describing the random number streams of the simulation.
+Every subsystem (new particles, wind, emission, ground, ...) draws from
+its own seeded NumPy generator, in whole arrays per step. The stream of a
+subsystem depends only on the seed and on its name, so adding a subsystem
+or changing how many numbers one of them draws does not change the others,
+and runs with the same seed are bit-reproducible.
+It is used to:
+- create one random generator per subsystem from a single seed
+- derive seeds for worker processes from the stream of a subsystem
+"""
+class RandomStreams:
+    def __init__(self, seed=None):
+        """
+        Args:
+            seed: Seed of the whole simulation, None takes a fresh seed from the system
+        """
+        self.root = np.random.SeedSequence(seed)
+        # Entropy actually used, pass it as the seed to repeat a run without a seed
+        self.seed = self.root.entropy
+        self.generators = {}
+
+    def sequence(self, name: str):
+        """
+        Seed sequence of the named stream, for seeding generators in other processes
+        """
+        key = zlib.crc32(name.encode())
+        return np.random.SeedSequence(self.seed, spawn_key=self.root.spawn_key + (key,))
+
+    def get(self, name: str):
+        """
+        Returns the generator of the named stream, created on first use
+        """
+        generator = self.generators.get(name)
+        if generator is None:
+            generator = np.random.default_rng(self.sequence(name))
+            self.generators[name] = generator
+        return generator
@@ -0,0 +1,336 @@
+import mmap
+import struct
+import numpy as np
+
+"""
+This file contains the recording and replay of simulation frames.
+Every frame stores the state needed to draw the particles: position,
+size, color, rotation and active flag. The values are quantized to 8 or
+16-bit integers. Every value is predicted from the two frames before it,
+assuming it keeps changing at the same rate, and a frame stores only how
+it differs from the prediction: one-byte differences, only the rows that
+differ, or nothing at all, whichever is smallest. A full key frame is written at a
+fixed interval, so any frame can be decoded from the nearest key frame
+before it. Frames are only ever appended, so a recording that was cut off is
+readable up to its last complete frame.
+It is used to:
+- append the particle state of every frame to a recording file
+- memory-map a recording and index its frames
+- decode any frame by its index, for replay without physics
+"""
+
+MAGIC = b"SANDREC\0"
+VERSION = 1
+# Magic, version, position low (3), position extent (3), key frame interval
+FILE_HEADER = struct.Struct("<8sI3d3dI")
+# Frame size in bytes (with this header), particle count, simulated time, key frame flag
+FRAME_HEADER = struct.Struct("<IIdB")
+# Encoding and size in bytes of the data that follows
+BLOCK_HEADER = struct.Struct("<BI")
+# Number of rows stored with their index
+ROWS_HEADER = struct.Struct("<I")
+
+# Encodings of a block:
+# RAW - all values
+# UNCHANGED - nothing, the predicted values
+# DELTA - difference from the prediction for every value
+# SPARSE - only the rows that differ from the prediction, with their indices
+# PATCHED - one-byte differences, rows with larger differences stored whole with their indices
+RAW, UNCHANGED, DELTA, SPARSE, PATCHED = range(5)
+
+KEYFRAME_INTERVAL = 60
+# Sizes are quantized between 0 and this value
+SIZE_RANGE = 2.0
+
+# Quantized channels: name -> (type, components)
+CHANNELS = {
+    "position": (np.uint16, 3),
+    "size": (np.uint16, 1),
+    "color": (np.uint8, 4),
+    "rotation": (np.uint8, 3),
+    "active": (np.uint8, 1),
+}
+SIGNED = {np.dtype(np.uint8): np.int8, np.dtype(np.uint16): np.int16}
+
+
+def quantize(low, extent, position, size, color, rotation, active):
+    """
+    Returns:
+        Dictionary channel name -> quantized array, one row per particle
+    """
+    scale = 65535 / np.asarray(extent, dtype=np.float64)
+    return {
+        "position": np.rint(np.clip((position - low) * scale, 0, 65535)).astype(np.uint16),
+        "size": np.rint(np.clip(size * (65535 / SIZE_RANGE), 0, 65535)).astype(np.uint16)[:, None],
+        "color": np.rint(np.clip(color, 0, 1) * 255).astype(np.uint8),
+        # Full turns wrap around, like the angles themselves
+        "rotation": (np.floor(np.mod(rotation, 360) * (256 / 360)).astype(np.int64) & 255).astype(np.uint8),
+        "active": np.asarray(active, dtype=np.uint8)[:, None],
+    }
+
+
+def _pack_rows(indices: np.ndarray, rows: np.ndarray):
+    return ROWS_HEADER.pack(len(indices)) + indices.astype(np.uint32).tobytes() + rows.tobytes()
+
+
+def _unpack_rows(buffer, offset: int, dtype, components: int):
+    """
+    Returns:
+        (indices, rows, offset after the rows)
+    """
+    (count,) = ROWS_HEADER.unpack_from(buffer, offset)
+    offset += ROWS_HEADER.size
+    indices = np.frombuffer(buffer, dtype=np.uint32, count=count, offset=offset)
+    offset += indices.nbytes
+    rows = np.frombuffer(buffer, dtype=dtype, count=count * components, offset=offset).reshape(count, components)
+    return indices, rows, offset + rows.nbytes
+
+
+def _resize(array: np.ndarray, count: int):
+    """Channel with count rows, new rows start from zero"""
+    if len(array) >= count:
+        return array[:count]
+    resized = np.zeros((count,) + array.shape[1:], dtype=array.dtype)
+    resized[:len(array)] = array
+    return resized
+
+
+def predict(previous, before, name: str, count: int):
+    """
+    Predicted values of a channel
+    Args:
+        previous: Quantized channels of the previous frame, None for key frames
+        before: Quantized channels of the frame before it, None right after a key frame
+        name: Name of the channel
+        count: Number of rows of the predicted frame
+    """
+    if previous is None:
+        return None
+    predicted = _resize(previous[name], count)
+    if before is None:
+        return predicted.copy()
+    # Same change as in the last frame, unsigned arithmetic wraps around on both sides
+    return predicted + (predicted - _resize(before[name], count))
+
+
+def encode_block(current: np.ndarray, predicted: np.ndarray):
+    """
+    Encode a channel, as the difference from the prediction when that is smaller
+    Args:
+        current: Quantized channel of this frame
+        predicted: Predicted channel with the same shape, None for key frames
+    Returns:
+        (encoding, bytes to write)
+    """
+    if predicted is None:
+        return RAW, current.tobytes()
+    # Unsigned subtraction wraps around, so the decoder gets the exact value back
+    delta = (current - predicted).view(SIGNED[current.dtype])
+    changed = np.flatnonzero(delta.any(axis=1))
+    if len(changed) == 0:
+        return UNCHANGED, b""
+
+    # Size of every encoding, the smallest one is written
+    # A stored row is its uint32 index and its values
+    row_bytes = 4 + current.itemsize * current.shape[1]
+    sizes = {DELTA: delta.nbytes, SPARSE: len(changed) * row_bytes}
+    if delta.itemsize > 1:
+        wide = np.flatnonzero((np.abs(delta.astype(np.int32)) > 127).any(axis=1))
+        sizes[PATCHED] = delta.size + len(wide) * row_bytes
+    encoding = min(sizes, key=sizes.get)
+
+    if encoding == SPARSE:
+        return SPARSE, _pack_rows(changed, current[changed])
+    if encoding == PATCHED:
+        # The differences of the wide rows are cut to a byte, their rows replace them
+        return PATCHED, _pack_rows(wide, current[wide]) + delta.astype(np.int8).tobytes()
+    return DELTA, delta.tobytes()
+
+
+def decode_block(encoding: int, buffer, offset: int, predicted: np.ndarray, dtype, components: int, count: int):
+    """
+    Inverse of encode_block
+    Args:
+        encoding: Encoding of the block
+        buffer: Buffer with the data of the block at offset
+        predicted: Predicted channel with count rows, None for key frames
+        dtype, components: Type and number of components of the channel
+        count: Number of rows
+    """
+    signed = SIGNED[np.dtype(dtype)]
+    if encoding == RAW:
+        return np.frombuffer(buffer, dtype=dtype, count=count * components, offset=offset).reshape(count, components).copy()
+    if encoding == UNCHANGED:
+        return predicted
+    if encoding == DELTA:
+        delta = np.frombuffer(buffer, dtype=signed, count=count * components, offset=offset)
+        return predicted + delta.view(dtype).reshape(count, components)
+    indices, rows, offset = _unpack_rows(buffer, offset, dtype, components)
+    if encoding == SPARSE:
+        decoded = predicted
+    else:
+        delta = np.frombuffer(buffer, dtype=np.int8, count=count * components, offset=offset)
+        decoded = predicted + delta.astype(signed).view(dtype).reshape(count, components)
+    decoded[indices] = rows
+    return decoded
+
+
+"""
+This is a class describing the recorder of simulation frames.
+It is used to:
+- quantize the particle state of a frame
+- append key frames and delta frames to the recording file
+"""
+class FrameRecorder:
+    def __init__(self, path: str, low, extent, keyframe_interval: int = KEYFRAME_INTERVAL):
+        """
+        Args:
+            path: Path of the recording file, an existing file is replaced
+            low: Lowest corner of the box the positions are quantized in
+            extent: Size of the box along each axis, positions outside it are clamped
+            keyframe_interval: Number of frames between key frames
+        """
+        self.low = np.asarray(low, dtype=np.float64)
+        self.extent = np.asarray(extent, dtype=np.float64)
+        self.keyframe_interval = keyframe_interval
+        self.frame_count = 0
+        # Quantized channels of the last two frames, for the prediction
+        self.previous = None
+        self.before = None
+        self.file = open(path, "wb")
+        self.file.write(FILE_HEADER.pack(MAGIC, VERSION, *self.low, *self.extent, keyframe_interval))
+
+    def record(self, particles, time: float):
+        """
+        Append the state of the live particles
+        Args:
+            particles: ParticleStore of the storm
+            time: Simulated time of the frame in seconds
+        """
+        count = len(particles)
+        live = slice(0, count)
+        current = quantize(self.low, self.extent, particles.position[live], particles.size[live],
+                           particles.color[live], particles.rotation[live], particles.active[live])
+        key = self.previous is None or self.frame_count % self.keyframe_interval == 0
+        if key:
+            # Frames after a key frame must not depend on frames before it
+            self.previous = self.before = None
+
+        blocks = []
+        for name in CHANNELS:
+            predicted = predict(self.previous, self.before, name, count)
+            encoding, data = encode_block(current[name], predicted)
+            blocks.append(BLOCK_HEADER.pack(encoding, len(data)))
+            blocks.append(data)
+        size = FRAME_HEADER.size + sum(len(block) for block in blocks)
+        self.file.write(FRAME_HEADER.pack(size, count, time, key))
+        self.file.write(b"".join(blocks))
+
+        self.before = self.previous
+        self.previous = current
+        self.frame_count += 1
+
+    def close(self):
+        self.file.close()
+
+
+"""
+This is a class describing the player of recorded frames.
+The recording is memory-mapped, so opening even a long recording only
+reads the frame headers, and the data of a frame is read from the map
+when the frame is decoded.
+It is used to:
+- index the frames of a recording
+- decode a frame by its index, stepping forward from the last decoded frame when possible
+- turn the quantized values back into arrays for the renderer
+"""
+class FramePlayer:
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, *values = FILE_HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a sand storm recording")
+        self.low = np.array(values[0:3])
+        self.extent = np.array(values[3:6])
+        self.keyframe_interval = values[6]
+
+        # Offset, particle count, time and key frame flag of every complete frame
+        offsets, counts, times, keys = [], [], [], []
+        offset = FILE_HEADER.size
+        while offset + FRAME_HEADER.size <= len(self.map):
+            size, count, time, key = FRAME_HEADER.unpack_from(self.map, offset)
+            if offset + size > len(self.map):
+                break
+            offsets.append(offset)
+            counts.append(count)
+            times.append(time)
+            keys.append(key)
+            offset += size
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.counts = np.array(counts, dtype=np.int64)
+        self.times = np.array(times)
+        self.key_frames = np.flatnonzero(keys)
+
+        self.decoded_index = None
+        self.decoded = None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _decode(self, index: int, previous, before):
+        """
+        Quantized channels of a frame
+        Args:
+            previous, before: Quantized channels of the two frames before it, see predict
+        """
+        count = int(self.counts[index])
+        offset = int(self.offsets[index]) + FRAME_HEADER.size
+        channels = {}
+        for name, (dtype, components) in CHANNELS.items():
+            encoding, nbytes = BLOCK_HEADER.unpack_from(self.map, offset)
+            offset += BLOCK_HEADER.size
+            # The data is read straight from the map, only the decoded arrays are new
+            predicted = None if encoding == RAW else predict(previous, before, name, count)
+            channels[name] = decode_block(encoding, self.map, offset, predicted, dtype, components, count)
+            offset += nbytes
+        return channels
+
+    def quantized_frame(self, index: int):
+        """
+        Quantized channels of a frame, decoded from the nearest key frame before it
+        or from the last decoded frame if that is closer
+        """
+        if not 0 <= index < len(self):
+            raise IndexError(f"Frame {index} is out of range, the recording has {len(self)} frames")
+        key = int(self.key_frames[np.searchsorted(self.key_frames, index, side="right") - 1])
+        if self.decoded_index is not None and key <= self.decoded_index <= index:
+            start, (channels, previous) = self.decoded_index, self.decoded
+        else:
+            start, channels, previous = key, self._decode(key, None, None), None
+        for step in range(start + 1, index + 1):
+            # The frame before the key frame is not used, as in the recorder
+            channels, previous = self._decode(step, channels, previous), channels
+        self.decoded_index, self.decoded = index, (channels, previous)
+        return channels
+
+    def frame(self, index: int):
+        """
+        Returns:
+            (position, size, rotation, color, active) arrays of the frame, ready for the renderer
+        """
+        channels = self.quantized_frame(index)
+        position = channels["position"] * (self.extent / 65535) + self.low
+        size = channels["size"][:, 0] * (SIZE_RANGE / 65535)
+        rotation = channels["rotation"] * (360 / 256)
+        color = channels["color"] / 255
+        active = channels["active"][:, 0].astype(bool)
+        return position, size, rotation, color, active
+
+    def time(self, index: int):
+        """Simulated time of a frame in seconds"""
+        return float(self.times[index])
+
+    def close(self):
+        self.decoded = None
+        self.map.close()
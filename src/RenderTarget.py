@@ -0,0 +1,84 @@
+from OpenGL.GL import *
+
+"""
+This is a class describing an offscreen render target.
+Drawing between begin and end goes into a color texture instead of the
+window, and the texture can then be drawn any number of times. This way
+something that rarely changes is drawn once and reused on later frames.
+It is used to:
+- create a framebuffer with a color texture (and an optional depth buffer)
+- resize the framebuffer with the window
+- redirect drawing to the texture and back to the window
+- clear the texture
+"""
+class RenderTarget:
+    def __init__(self, width: int, height: int, depth: bool = False):
+        """
+        Args:
+            width, height: Size of the texture in pixels
+            depth: Whether to attach a depth buffer
+        """
+        self.width = 0
+        self.height = 0
+        self.depth = depth
+        self.framebuffer = glGenFramebuffers(1)
+        self.texture = glGenTextures(1)
+        self.depth_buffer = glGenRenderbuffers(1) if depth else None
+        self.saved_viewport = None
+        self.resize(width, height)
+
+    def resize(self, width: int, height: int):
+        """
+        Reallocate the texture for a new size, the old content is lost
+        Returns:
+            True if the size changed
+        """
+        width, height = max(int(width), 1), max(int(height), 1)
+        if (width, height) == (self.width, self.height):
+            return False
+        self.width, self.height = width, height
+
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA8, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, self.texture, 0)
+        if self.depth:
+            glBindRenderbuffer(GL_RENDERBUFFER, self.depth_buffer)
+            glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24, width, height)
+            glBindRenderbuffer(GL_RENDERBUFFER, 0)
+            glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER, self.depth_buffer)
+        status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        if status != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError(f"Framebuffer is incomplete: {status}")
+        return True
+
+    def begin(self):
+        """Draw into the texture, the viewport covers the whole texture"""
+        self.saved_viewport = glGetIntegerv(GL_VIEWPORT)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+        glViewport(0, 0, self.width, self.height)
+
+    def clear(self, color):
+        """Clear the texture to a color, the clear color of the window is kept"""
+        saved_color = glGetFloatv(GL_COLOR_CLEAR_VALUE)
+        glClearColor(*color)
+        glClear(GL_COLOR_BUFFER_BIT | (GL_DEPTH_BUFFER_BIT if self.depth else 0))
+        glClearColor(*saved_color)
+
+    def end(self):
+        """Draw into the window again"""
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        glViewport(*self.saved_viewport)
+
+    def delete(self):
+        glDeleteFramebuffers(1, [self.framebuffer])
+        glDeleteTextures([self.texture])
+        if self.depth_buffer is not None:
+            glDeleteRenderbuffers(1, [self.depth_buffer])
@@ -1,61 +1,119 @@
 import pygame
-import random
-from src.consts import TERRAIN_SIZE
-from src.SandParticle import SandParticle
+import numpy as np
+from src.consts import TERRAIN_SIZE, CLUSTER_RADIUS, COHESION_STRENGTH, LOD_MESH_DISTANCE, LOD_BILLBOARD_DISTANCE
+from src.ParticleStore import ParticleStore
+from src.ParticlePhysics import PhysicsScratch, advance_particles, interact_particles
+from src.RandomStreams import RandomStreams
+from src.SpatialHash import SpatialHash, find_clusters
+from src.WindField import WindField
+from src.Recording import FrameRecorder
+from src.Emission import EmissionMap
 
 """
 This is a class describing the sandstorm.
 It is used to:
 - simulate the movement of sand particles in the sandstorm depending on the wind
-- draw the sand particles in the sandstorm
+- draw the sand particles in the sandstorm that are in view
 - update the sand particles in the sandstorm
 - add new particles to the sandstorm
 - remove particles that went too far vertically or hit walls twice
 - generate new particles from terrain if provided
+- keep particles above the terrain surface
+- let nearby particles stick together in clusters
+- record the particles of every update to a file
 - update the wind direction and strength
 - update the parameters of the sandstorm
 - update the particle properties
 """
 class SandStorm:
-    def __init__(self, position: pygame.Vector3, num_particles: int = 100, max_particles: int = 5000):
+    def __init__(self, position: pygame.Vector3, num_particles: int = 100, max_particles: int = 5000,
+                 capacity: int = None, workers: int = 0, seed=None):
+        """
+        Args:
+            position: Center of the storm
+            num_particles: Number of particles created at the start
+            max_particles: Maximum number of particles
+            capacity: Size of the preallocated particle pool, defaults to max_particles.
+                Set it to the largest value max_particles can take to avoid reallocating later.
+            workers: Number of worker processes advancing the particles in parallel,
+                0 runs the simulation in this process
+            seed: Seed of the random streams, runs with the same seed
+                give the same results. None takes a fresh seed.
+        """
         self.position = position
         self.wind = pygame.Vector3(2.0, 1.2, 0.0)  # Default wind direction (right and slightly up)
-        self.particles = []
+        # Separate random stream for every part of the simulation
+        self.random = RandomStreams(seed)
+        capacity = max(capacity or 0, max_particles, num_particles)
+
+        # With workers the particle arrays are placed in shared memory
+        self.backend = None
+        allocator = None
+        if workers > 0:
+            from src.ParallelSimulation import ParallelBackend
+            self.backend = ParallelBackend(workers)
+            allocator = self.backend.allocate
+        self.particles = ParticleStore(capacity, self.random.get("particles"), allocator)
+        self._scratch = PhysicsScratch()
+        self._reserve_scratch(capacity)
+        self.grid = SpatialHash(CLUSTER_RADIUS)
+        # Wind with gusts over the domain the particles can reach
+        self.wind_field = WindField(self.position, TERRAIN_SIZE,
+                                    seed=int(self.random.get("wind").integers(2 ** 31)))
+        # Interacting pairs of the last update
+        self.pairs = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+        self.renderer = None
+        self.recorder = None
+        # Weighted source vertices of the terrain, built on the first emission
+        self.emission = None
         self.num_particles = num_particles
-        
+
         # Performance settings
         self.MAX_PARTICLES = max_particles
         self.PARTICLES_PER_VERTEX = 2
         self.MAX_VERTICES_PER_FRAME = 30
-        self.SAND_GENERATION_INTERVAL = 100
-        self.last_sand_generation = pygame.time.get_ticks()
-        
+        self.SAND_GENERATION_INTERVAL = 100  # Milliseconds of simulated time
+        self.last_sand_generation = 0.0
+        # Scales of the emission rate and the level of detail distances, lowered under load
+        self.emission_scale = 1.0
+        self.lod_scale = 1.0
+
+        # Simulated time in milliseconds, advanced only by update
+        self.simulation_time = 0.0
+
         # New parameters
         self.wind_strength = 2.0
         self.wind_turbulence = 0.2
         self.particle_mass = 1.0
+        self.cohesion = COHESION_STRENGTH
         self.particle_lifetime = 5.0
         self.particle_color = 0.5
         self.particle_size = 0.01
         self.sky_intensity = 1.0
-        
+
         # Initialize particles
         self._initialize_particles()
 
+    def _reserve_scratch(self, capacity: int):
+        """
+        Allocate the temporary arrays used by update, one entry per particle
+        """
+        self._scratch.reserve(capacity)
+        # Removal mask, written by the workers when the simulation runs in parallel
+        if self.backend is not None:
+            self._to_remove = self.backend.allocate("to_remove", (capacity,), bool)
+        else:
+            self._to_remove = np.zeros(capacity, dtype=bool)
+
     def _initialize_particles(self):
         """
         Create initial set of particles around the storm's position
         """
-        for _ in range(self.num_particles):
-            # Random position within a sphere around the storm's position
-            offset = pygame.Vector3(
-                random.uniform(-1, 1),
-                random.uniform(-1, 1),
-                random.uniform(-1, 1)
-            ).normalize() * random.uniform(0, 2)
-            
-            particle_pos = self.position + offset
-            self.particles.append(SandParticle(particle_pos))
+        new = self.particles.add(self.num_particles, self.particle_size)
+        # Random position within a sphere around the storm's position
+        self._place_around(self.particles.position[new], 1.0, 2.0)
+        self.particles.position[new] += np.array(self.position)
+        self.particles.previous_position[new] = self.particles.position[new]
 
     def set_wind(self, wind_vector: pygame.Vector3):
         """
@@ -65,8 +123,9 @@ class SandStorm:
         """
         self.wind = wind_vector
 
-    def set_parameters(self, wind_strength=None, wind_turbulence=None, particle_mass=None, 
-                      particle_lifetime=None, particle_color=None, sky_intensity=None, particle_size=None):
+    def set_parameters(self, wind_strength=None, wind_turbulence=None, particle_mass=None,
+                      particle_lifetime=None, particle_color=None, sky_intensity=None, particle_size=None,
+                      cohesion=None):
         """
         Update storm parameters
         """
@@ -77,6 +136,8 @@ class SandStorm:
             self.wind_turbulence = wind_turbulence
         if particle_mass is not None:
             self.particle_mass = particle_mass
+        if cohesion is not None:
+            self.cohesion = cohesion
         if particle_lifetime is not None:
             self.particle_lifetime = particle_lifetime
         if particle_color is not None:
@@ -85,91 +146,179 @@ class SandStorm:
             self.sky_intensity = sky_intensity
         if particle_size is not None:
             # Update particle sizes for all particles
-            for particle in self.particles:
-                if random.random() < 0.9:
-                    particle.size = random.uniform(particle_size * 0.2, particle_size * 0.6)
-                else:
-                    particle.size = random.uniform(particle_size * 0.6, particle_size)
+            count = len(self.particles)
+            rng = self.random.get("sizes")
+            small = rng.random(count) < 0.9
+            self.particles.size[:count] = np.where(
+                small,
+                rng.uniform(particle_size * 0.2, particle_size * 0.6, count),
+                rng.uniform(particle_size * 0.6, particle_size, count),
+            )
 
     def update(self, delta_time: float, terrain=None):
         """
         Update all particles in the storm and generate new ones from terrain if provided
         Args:
             delta_time: Time since last update
-            terrain: Optional terrain object to generate particles from
+            terrain: Optional terrain or height map object to generate particles from
         """
-        # Update existing particles
-        particles_to_remove = set()  # Changed to set for O(1) lookups
+        particles = self.particles
+        count = len(particles)
         half_terrain = TERRAIN_SIZE // 2
-        
-        for particle in self.particles:
-            if particle.active:
-                # Apply wind with turbulence
-                wind_with_turbulence = self.wind + pygame.Vector3(
-                    random.uniform(-self.wind_turbulence, self.wind_turbulence),
-                    random.uniform(-self.wind_turbulence, self.wind_turbulence),
-                    random.uniform(-self.wind_turbulence, self.wind_turbulence)
-                )
-                
-                particle.update(wind_with_turbulence, delta_time, self.particle_mass)
-                
-                # Check if particle is too far vertically
-                if abs(particle.position.y - self.position.y) > half_terrain:
-                    particles_to_remove.add(particle)
-                    continue
-                
-                # Handle horizontal wrapping (X and Z coordinates)
-                if abs(particle.position.x - self.position.x) > half_terrain:
-                    if particle.has_wrapped:
-                        # If particle has already wrapped once, remove it
-                        particles_to_remove.add(particle)
-                    else:
-                        # Calculate the offset from the center
-                        offset = particle.position.x - self.position.x
-                        # Wrap to the opposite side
-                        particle.position.x = self.position.x - offset
-                        particle.has_wrapped = True
-                
-                if abs(particle.position.z - self.position.z) > half_terrain:
-                    if particle.has_wrapped:
-                        # If particle has already wrapped once, remove it
-                        particles_to_remove.add(particle)
-                    else:
-                        # Calculate the offset from the center
-                        offset = particle.position.z - self.position.z
-                        # Wrap to the opposite side
-                        particle.position.z = self.position.z - offset
-                        particle.has_wrapped = True
-        
-        # Remove particles that went too far vertically or hit walls twice
-        self.particles = [p for p in self.particles if p not in particles_to_remove]
-        self.num_particles = len(self.particles)
+
+        if count > 0:
+            # Kept for drawing between this update and the next one
+            particles.previous_position[:count] = particles.position[:count]
+            self.wind_field.update(self.simulation_time / 1000, self.wind, self.wind_turbulence)
+            settings = {
+                "wind_field": self.wind_field.state(),
+                "particle_mass": self.particle_mass,
+                "center": np.array(self.position),
+                "half_terrain": half_terrain,
+            }
+            if self.backend is not None:
+                self.backend.step(count, delta_time, settings, terrain)
+            else:
+                collision = None if terrain is None else (terrain.height_map, terrain.size)
+                advance_particles(particles, 0, count, delta_time, settings,
+                                  self._scratch, self._to_remove, collision)
+
+            # Remove particles that went too far vertically or hit walls twice
+            particles.remove(self._to_remove[:count])
+
+            # Cohesion and collision between nearby particles, for the whole storm at once
+            if self.cohesion > 0:
+                self.pairs = interact_particles(particles, len(particles), self.grid,
+                                                delta_time, self.cohesion)
+        self.num_particles = len(particles)
+        self.simulation_time += delta_time * 1000
 
         # Generate new particles from terrain if provided
         if terrain is not None:
-            current_time = pygame.time.get_ticks()
+            current_time = self.simulation_time
             if current_time - self.last_sand_generation >= self.SAND_GENERATION_INTERVAL:
-                terrain_vertices = terrain.get_vertices()
-                
-                if len(self.particles) < self.MAX_PARTICLES:
-                    vertices_to_process = min(self.MAX_VERTICES_PER_FRAME, len(terrain_vertices) // 3)
-                    vertex_indices = random.sample(range(0, len(terrain_vertices), 3), vertices_to_process)
-                    
-                    for i in vertex_indices:
-                        if len(self.particles) >= self.MAX_PARTICLES:
-                            break
-                        x, y, z = terrain_vertices[i:i+3]
-                        self.add_particles(self.PARTICLES_PER_VERTEX, pygame.Vector3(x, y, z))
-                
+                room = self.MAX_PARTICLES - len(self.particles)
+
+                if room > 0:
+                    if self.emission is None or self.emission.terrain is not terrain:
+                        self.emission = EmissionMap(terrain)
+                    self.emission.set_wind(self.wind)
+                    # Stop taking vertices once the storm is full
+                    vertices_to_process = min(round(self.MAX_VERTICES_PER_FRAME * self.emission_scale),
+                                              -(-room // self.PARTICLES_PER_VERTEX))
+                    vertex_indices = self.emission.sample(self.random.get("emission"), vertices_to_process)
+                    self._spawn(self.emission.vertices, vertex_indices.repeat(self.PARTICLES_PER_VERTEX))
+
                 self.last_sand_generation = current_time
 
-    def draw(self):
+        if self.recorder is not None:
+            self.recorder.record(self.particles, self.simulation_time / 1000)
+
+    def start_recording(self, path: str):
         """
-        Draw all active particles
+        Record the particles after every update to a file, see src/Recording.py
+        """
+        self.stop_recording()
+        # Positions are quantized in a box around the storm, twice the terrain size
+        low = np.array(self.position) - TERRAIN_SIZE
+        self.recorder = FrameRecorder(path, low, np.full(3, 2.0 * TERRAIN_SIZE))
+
+    def stop_recording(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def draw(self, eye=None, frustum=None, alpha: float = 1.0):
+        """
+        Draw the active particles, with one instanced draw call per level of detail
+        Args:
+            eye: Position of the camera, it selects the level of detail of every particle.
+                Without it all particles are drawn as sphere meshes.
+            frustum: View frustum, particles outside it are not drawn. None draws all particles.
+            alpha: Where to draw the particles between the last two updates, see interpolated_positions
+        """
+        particles = self.particles
+        live = slice(0, len(particles))
+        self.draw_particles(self.interpolated_positions(alpha), particles.size[live], particles.rotation[live],
+                            particles.color[live], particles.active[live], eye, frustum)
+
+    def interpolated_positions(self, alpha: float):
+        """
+        Positions of the live particles between the last two updates
+        Args:
+            alpha: 0 gives the positions before the last update, 1 the current ones
         """
-        for particle in self.particles:
-            if particle.active:
-                particle.draw(self.particle_color)
+        count = len(self.particles)
+        current = self.particles.position[:count]
+        if alpha >= 1.0:
+            return current
+        previous = self.particles.previous_position[:count]
+        position = current - previous
+        # Particles that wrapped around the terrain are drawn where they are now
+        jumped = np.abs(position).max(axis=1) > TERRAIN_SIZE / 2
+        position *= alpha
+        position += previous
+        position[jumped] = current[jumped]
+        return position
+
+    def draw_particles(self, position, size, rotation, color, active, eye=None, frustum=None):
+        """
+        Draw the active particles of the given arrays, also used to replay recorded frames
+        Args:
+            position, size, rotation, color, active: Particle arrays, see ParticleStore
+            eye, frustum: See draw
+        """
+        # Created on first draw, when the OpenGL context already exists.
+        # Imported here so that headless simulation never loads OpenGL.
+        if self.renderer is None:
+            from src.ParticleRenderer import ParticleRenderer
+            self.renderer = ParticleRenderer(self._lod_distances())
+
+        live = slice(0, len(size))
+        visible = active
+        if frustum is not None:
+            # The particle size is the radius of its sphere
+            visible = visible & frustum.spheres_visible(position, size)
+        if not visible.all():
+            live = np.flatnonzero(visible)
+        self.renderer.draw(position[live], size[live], rotation[live], color[live], eye)
+
+    def _place_around(self, offsets: np.ndarray, extent: float, radius: float):
+        """
+        Fill offsets with random points: a direction taken from a cube of the given
+        extent, normalized and scaled by a random length up to radius
+        """
+        count = len(offsets)
+        rng = self.random.get("spawn")
+        rng.random(out=offsets)
+        offsets *= 2 * extent
+        offsets -= extent
+        length = self._scratch.scalar[:count]
+        np.einsum("ij,ij->i", offsets, offsets, out=length)
+        np.sqrt(length, out=length)
+        offsets /= length[:, None]
+        offsets *= rng.random(out=length)[:, None] * radius
+
+    def _spawn(self, spawn_points: np.ndarray, point_indices: np.ndarray = None):
+        """
+        Add one particle around every spawn point
+        Args:
+            spawn_points: Array of shape (N, 3) with the spawn points
+            point_indices: Optional indices into spawn_points, one per new particle.
+                If None, one particle is added for every spawn point.
+        """
+        count = len(spawn_points) if point_indices is None else len(point_indices)
+        new = self.particles.add(count, self.particle_size)
+        position = self.particles.position[new]
+        count = len(position)
+
+        self._place_around(position, 0.5, 1.0)
+        if point_indices is None:
+            position += spawn_points[:count]
+        else:
+            position += spawn_points[point_indices[:count]]
+        self.particles.previous_position[new] = position
+        self.num_particles = len(self.particles)
 
     def add_particles(self, num_particles: int, spawn_point: pygame.Vector3 = None):
         """
@@ -179,17 +328,24 @@ class SandStorm:
             spawn_point: Optional Vector3 point where particles should spawn. If None, uses storm's position
         """
         spawn_position = spawn_point if spawn_point is not None else self.position
-        
-        for _ in range(num_particles):
-            offset = pygame.Vector3(
-                random.uniform(-0.5, 0.5),
-                random.uniform(-0.5, 0.5),
-                random.uniform(-0.5, 0.5)
-            ).normalize() * random.uniform(0, 1)
-            
-            particle_pos = spawn_position + offset
-            self.particles.append(SandParticle(particle_pos, self.particle_size))
-            self.num_particles += 1
+        self._spawn(np.array([spawn_position]), np.zeros(num_particles, dtype=np.int64))
+
+    def _lod_distances(self):
+        return LOD_MESH_DISTANCE * self.lod_scale, LOD_BILLBOARD_DISTANCE * self.lod_scale
+
+    def set_quality(self, emission_scale=None, lod_scale=None):
+        """
+        Trade detail for speed, see src/QualityController.py
+        Args:
+            emission_scale: Part of the usual number of terrain vertices that emit sand
+            lod_scale: Scale of the distances up to which particles are drawn as meshes and billboards
+        """
+        if emission_scale is not None:
+            self.emission_scale = emission_scale
+        if lod_scale is not None:
+            self.lod_scale = lod_scale
+            if self.renderer is not None:
+                self.renderer.lod_distances = self._lod_distances()
 
     def set_max_particles(self, max_particles: int):
         """
@@ -198,10 +354,37 @@ class SandStorm:
             max_particles: New maximum number of particles
         """
         self.MAX_PARTICLES = max_particles
+        # Grow the pool only when the new maximum does not fit
+        if max_particles > self.particles.capacity:
+            self.particles.reserve(max_particles)
+            self._reserve_scratch(max_particles)
         # Remove excess particles if necessary
-        while len(self.particles) > self.MAX_PARTICLES:
-            self.particles.pop()
-            self.num_particles -= 1
+        if len(self.particles) > self.MAX_PARTICLES:
+            self.particles.truncate(self.MAX_PARTICLES)
+            self.num_particles = len(self.particles)
+
+    def clusters(self):
+        """
+        Group the particles that interacted in the last update into clusters
+        Returns:
+            Array with the cluster label of every particle
+        """
+        first, second = self.pairs
+        count = len(self.particles)
+        if len(first) and max(first.max(), second.max()) >= count:
+            # Particles were removed since the last update
+            return np.arange(count)
+        return find_clusters(first, second, count)
+
+    def close(self):
+        """
+        Finish the recording and stop the worker processes and free the shared memory,
+        if the simulation runs in parallel
+        """
+        self.stop_recording()
+        if self.backend is not None:
+            self.backend.close()
+            self.backend = None
 
     def update_particle_properties(self,
                                  particle_lifetime=None,
@@ -210,6 +393,6 @@ class SandStorm:
         if particle_lifetime is not None:
             self.particle_lifetime = particle_lifetime
         if particle_color is not None:
-            self.particle_color = particle_color 
+            self.particle_color = particle_color
         if particle_size is not None:
-            self.particle_size = particle_size
\ No newline at end of file
+            self.particle_size = particle_size
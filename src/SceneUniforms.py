@@ -0,0 +1,86 @@
+import numpy as np
+from OpenGL.GL import *
+from src.Lighting import LIGHT_POSITION, LIGHT_AMBIENT, LIGHT_DIFFUSE
+
+# Binding point of the scene uniform buffer, the same in every program
+SCENE_BINDING = 0
+
+# Declaration of the buffer for the shaders, the std140 layout matches SCENE_LAYOUT
+SCENE_BLOCK = """
+layout(std140) uniform Scene {
+    mat4 projection;
+    mat4 view;
+    vec4 light_position;  // Eye space
+    vec4 light_ambient;
+    vec4 light_diffuse;
+    vec4 viewport;        // x, y, width and height in pixels
+};
+"""
+
+# Offsets of the block members in floats
+SCENE_LAYOUT = {
+    "projection": slice(0, 16),
+    "view": slice(16, 32),
+    "light_position": slice(32, 36),
+    "light_ambient": slice(36, 40),
+    "light_diffuse": slice(40, 44),
+    "viewport": slice(44, 48),
+}
+SCENE_FLOATS = 48
+
+"""
+This is a class describing the uniform buffer shared by all 3D passes.
+The camera matrices, the light and the viewport are the same for the
+terrain, ground, sky and particle shaders, so they live in one buffer
+bound to SCENE_BINDING instead of being set in every program. The buffer
+is uploaded at most once per frame, and only when something in it has
+changed, so a still camera costs no upload at all.
+It is used to:
+- create the buffer and bind it to the scene binding point
+- fill it from the camera and the viewport
+- upload it when it has changed
+"""
+class SceneUniforms:
+    def __init__(self):
+        self.data = np.zeros(SCENE_FLOATS, dtype=np.float32)
+        self.data[SCENE_LAYOUT["light_ambient"]] = (*LIGHT_AMBIENT, 1.0)
+        self.data[SCENE_LAYOUT["light_diffuse"]] = (*LIGHT_DIFFUSE, 1.0)
+        # Contents of the buffer on the GPU, None before the first upload
+        self.uploaded = None
+        self.upload_count = 0
+
+        self.buffer = glGenBuffers(1)
+        glBindBuffer(GL_UNIFORM_BUFFER, self.buffer)
+        glBufferData(GL_UNIFORM_BUFFER, self.data.nbytes, None, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+        glBindBufferBase(GL_UNIFORM_BUFFER, SCENE_BINDING, self.buffer)
+
+    def update(self, camera, viewport):
+        """
+        Fill the buffer for a frame, call once before the 3D passes
+        Args:
+            camera: Camera with the projection and view matrices
+            viewport: (x, y, width, height) of the 3D view in pixels
+        Returns:
+            True when the buffer was uploaded, False when nothing has changed
+        """
+        data = self.data
+        # The matrices are stored as glLoadMatrixf reads them, which is the column-major order of GLSL
+        view = np.asarray(camera.get_VM(), dtype=np.float32)
+        data[SCENE_LAYOUT["projection"]] = np.asarray(camera.get_PPM(), dtype=np.float32).ravel()
+        data[SCENE_LAYOUT["view"]] = view.ravel()
+        # Like glLightfv(GL_POSITION), the light is moved into eye space once
+        data[SCENE_LAYOUT["light_position"]] = np.array((*LIGHT_POSITION, 1.0), dtype=np.float32) @ view
+        data[SCENE_LAYOUT["viewport"]] = viewport
+        if self.uploaded is not None and np.array_equal(data, self.uploaded):
+            return False
+
+        glBindBuffer(GL_UNIFORM_BUFFER, self.buffer)
+        glBufferSubData(GL_UNIFORM_BUFFER, 0, data.nbytes, data)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+        self.uploaded = data.copy()
+        self.upload_count += 1
+        return True
+
+    def delete(self):
+        glDeleteBuffers(1, [self.buffer])
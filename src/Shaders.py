@@ -0,0 +1,74 @@
+from OpenGL.GL import *
+
+"""
+This file contains helpers for the shader programs.
+It is used to:
+- compile vertex and fragment shaders
+- link them into a program with fixed attribute locations and uniform block bindings
+- keep one program per set of sources, so programs shared by several objects are compiled once
+"""
+
+_programs = {}
+
+
+def compile_shader(source: str, shader_type):
+    """
+    Compile a single shader and raise an error with the driver log if it fails
+    Args:
+        source: GLSL source code
+        shader_type: GL_VERTEX_SHADER or GL_FRAGMENT_SHADER
+    """
+    shader = glCreateShader(shader_type)
+    glShaderSource(shader, source)
+    glCompileShader(shader)
+    if not glGetShaderiv(shader, GL_COMPILE_STATUS):
+        log = glGetShaderInfoLog(shader)
+        glDeleteShader(shader)
+        raise RuntimeError(f"Shader compilation failed: {log}")
+    return shader
+
+
+def create_program(vertex_source: str, fragment_source: str, attributes=(), uniform_blocks=None):
+    """
+    Build a shader program
+    Args:
+        vertex_source: GLSL source of the vertex shader
+        fragment_source: GLSL source of the fragment shader
+        attributes: Attribute names, bound to locations 0, 1, 2... in the given order
+        uniform_blocks: Optional dictionary uniform block name -> binding point
+    """
+    vertex_shader = compile_shader(vertex_source, GL_VERTEX_SHADER)
+    fragment_shader = compile_shader(fragment_source, GL_FRAGMENT_SHADER)
+
+    program = glCreateProgram()
+    glAttachShader(program, vertex_shader)
+    glAttachShader(program, fragment_shader)
+    for location, name in enumerate(attributes):
+        glBindAttribLocation(program, location, name)
+    glLinkProgram(program)
+
+    # Shaders are not needed once the program is linked
+    glDeleteShader(vertex_shader)
+    glDeleteShader(fragment_shader)
+
+    if not glGetProgramiv(program, GL_LINK_STATUS):
+        log = glGetProgramInfoLog(program)
+        glDeleteProgram(program)
+        raise RuntimeError(f"Shader program linking failed: {log}")
+
+    # Blocks the compiler removed because no shader reads them are skipped
+    for name, binding in (uniform_blocks or {}).items():
+        index = glGetUniformBlockIndex(program, name)
+        if index != GL_INVALID_INDEX:
+            glUniformBlockBinding(program, index, binding)
+    return program
+
+
+def get_program(vertex_source: str, fragment_source: str, attributes=(), uniform_blocks=None):
+    """Returns the cached program for the given sources, the arguments are the same as for create_program"""
+    key = (vertex_source, fragment_source, tuple(attributes), tuple(sorted((uniform_blocks or {}).items())))
+    program = _programs.get(key)
+    if program is None:
+        program = create_program(vertex_source, fragment_source, attributes, uniform_blocks)
+        _programs[key] = program
+    return program
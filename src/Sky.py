@@ -1,10 +1,20 @@
+import ctypes
 import numpy as np
 from OpenGL.GL import *
-from OpenGL.GLU import *
 from src.consts import *
+from src.ParticleRenderer import build_sphere
+from src.Shaders import get_program
+from src.SceneUniforms import SCENE_BLOCK, SCENE_BINDING
+from src.Lighting import LIGHTING
 
 """
 This is a class describing the sky.
+The sky box and the sun glow never move, so their geometry is built once
+into GPU buffers and every frame draws them with one call each. Only the
+colors of the sky box depend on the slider; they are kept in their own
+buffer, which is uploaded again only after the colors change. Both are
+lit by the light of the scene in the sky shader, the walls of the box
+share one normal.
 It is used to:
 - draw the sky
 - update the sky colors
@@ -12,107 +22,187 @@ It is used to:
 - draw the sun
 - draw the sun glow effect
 """
+
+# Color slots of the sky box vertices
+SKY, SUNSET, HORIZON = range(3)
+
+# Quads of the sky box, as (color slot, four corners)
+SKY_QUADS = [
+    # Back wall (sky gradient)
+    (SKY, [(-20, 20, -20), (20, 20, -20), (20, 0, -20), (-20, 0, -20)]),
+    (SUNSET, [(-20, 0, -20), (20, 0, -20), (20, -2, -20), (-20, -2, -20)]),
+    # Left wall
+    (SKY, [(-20, 20, -20), (-20, 20, 20), (-20, 0, 20), (-20, 0, -20)]),
+    (SUNSET, [(-20, 0, -20), (-20, 0, 20), (-20, -2, 20), (-20, -2, -20)]),
+    # Right wall
+    (SKY, [(20, 20, -20), (20, 20, 20), (20, 0, 20), (20, 0, -20)]),
+    (SUNSET, [(20, 0, -20), (20, 0, 20), (20, -2, 20), (20, -2, -20)]),
+    # Top wall (ceiling)
+    (SKY, [(-20, 20, -20), (20, 20, -20), (20, 20, 20), (-20, 20, 20)]),
+    # Bottom wall (floor sky reflection)
+    (HORIZON, [(-20, -2, -20), (20, -2, -20), (20, -2, 20), (-20, -2, 20)]),
+]
+
+# Glow spheres around the sun as (scale, alpha)
+SUN_GLOW_LAYERS = [(1.0 + i * 0.3, 0.3 - i * 0.1) for i in range(3)]
+SUN_GLOW_SLICES = 32
+SUN_GLOW_STACKS = 32
+
+# One normal shared by all walls of the sky box
+SKY_NORMAL = (0.0, 0.0, 1.0)
+
+SKY_VERTEX_SHADER = """
+#version 330
+""" + SCENE_BLOCK + LIGHTING + """
+in vec3 vertex;
+in vec4 color;
+in vec3 normal;
+out vec4 sky_color;
+
+void main() {
+    vec4 eye = view * vec4(vertex, 1.0);
+    gl_Position = projection * eye;
+    sky_color = vec4(light_color(color.rgb, normalize(mat3(view) * normal), eye.xyz), color.a);
+}
+"""
+
+SKY_FRAGMENT_SHADER = """
+#version 330
+in vec4 sky_color;
+out vec4 fragment_color;
+
+void main() {
+    fragment_color = sky_color;
+}
+"""
+
+
 class Sky:
     def __init__(self):
         self.sun_position = np.array([-5.0, 15.0, -15.0])
         self.sun_radius = 1.0
         self.sun_color = (1.0, 0.7, 0.3, 1.0)  # Orange color for sun
-        
+
         # Initialize sky colors
         self.sky_color = list(SKY_COLOR)
         self.sunset_color = list(SUNSET_COLOR)
         self.horizon_color = list(HORIZON_COLOR)
-        
+
+        self.program = get_program(SKY_VERTEX_SHADER, SKY_FRAGMENT_SHADER,
+                                   attributes=("vertex", "color", "normal"), uniform_blocks={"Scene": SCENE_BINDING})
+        self._build_sky_box()
+        self._build_sun_glow()
+
+    def _build_sky_box(self):
+        """Sky box as triangles, with the color slot of every vertex"""
+        corners = np.array([quad for _, quad in SKY_QUADS], dtype=np.float32)
+        self.sky_vertices = corners.reshape(-1, 3)
+        self.sky_slots = np.repeat([slot for slot, _ in SKY_QUADS], 4)
+        # Two triangles for every quad, split along the same diagonal as GL_QUADS
+        first = np.arange(len(SKY_QUADS))[:, None] * 4
+        self.sky_indices = (first + np.array([0, 1, 3, 1, 2, 3])).ravel().astype(np.uint32)
+        self.sky_colors = np.zeros((len(self.sky_vertices), 3), dtype=np.float32)
+        self.colors_dirty = True
+
+        self.sky_vao = glGenVertexArrays(1)
+        self.sky_vbo = glGenBuffers(1)
+        self.sky_cbo = glGenBuffers(1)
+        self.sky_ibo = glGenBuffers(1)
+
+        glBindVertexArray(self.sky_vao)
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.sky_vbo)
+        glBufferData(GL_ARRAY_BUFFER, self.sky_vertices.nbytes, self.sky_vertices, GL_STATIC_DRAW)
+        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 0, None)
+        glEnableVertexAttribArray(0)
+
+        # Colors change with the slider
+        glBindBuffer(GL_ARRAY_BUFFER, self.sky_cbo)
+        glBufferData(GL_ARRAY_BUFFER, self.sky_colors.nbytes, None, GL_DYNAMIC_DRAW)
+        glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 0, None)
+        glEnableVertexAttribArray(1)
+
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.sky_ibo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, self.sky_indices.nbytes, self.sky_indices, GL_STATIC_DRAW)
+
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def _build_sun_glow(self):
+        """All glow spheres in one buffer around the sun, with their colors and normals baked in"""
+        sphere, sphere_indices = build_sphere(SUN_GLOW_SLICES, SUN_GLOW_STACKS)
+        vertices = []
+        indices = []
+        for layer, (scale, alpha) in enumerate(SUN_GLOW_LAYERS):
+            color = np.empty((len(sphere), 4), dtype=np.float32)
+            color[:] = (*self.sun_color[:3], alpha)
+            # Position, normal and color of every vertex
+            vertices.append(np.hstack((sphere * (self.sun_radius * scale) + self.sun_position, color, sphere)))
+            indices.append(sphere_indices + layer * len(sphere))
+        vertices = np.concatenate(vertices).astype(np.float32)
+        self.glow_indices = np.concatenate(indices).astype(np.uint32)
+
+        self.glow_vao = glGenVertexArrays(1)
+        self.glow_vbo = glGenBuffers(1)
+        self.glow_ibo = glGenBuffers(1)
+
+        glBindVertexArray(self.glow_vao)
+
+        stride = vertices.strides[0]
+        glBindBuffer(GL_ARRAY_BUFFER, self.glow_vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        for location, (components, offset) in enumerate(((3, 0), (4, 3), (3, 7))):
+            glVertexAttribPointer(location, components, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(offset * 4))
+            glEnableVertexAttribArray(location)
+
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.glow_ibo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, self.glow_indices.nbytes, self.glow_indices, GL_STATIC_DRAW)
+
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
     def update_colors(self, b):
         """Update sky colors based on RGB values (0-255)"""
         # Convert from 0-255 to 0-1 range
         r = 30 / 255.0
         g = 10 / 255.0
         b = b / 255.0
-        
+
         # Update main sky color
         self.sky_color = [r, g, b]
-        
+
         # Update sunset and horizon colors based on sky color
         self.sunset_color = [min(1.0, r + 0.7), min(1.0, g + 0.2), min(1.0, b - 0.2)]
         self.horizon_color = [min(1.0, r + 0.8), min(1.0, g + 0.4), min(1.0, b - 0.1)]
-        
+
+        # Uploaded on the next draw
+        self.colors_dirty = True
+
+    def _upload_colors(self):
+        palette = np.array([self.sky_color, self.sunset_color, self.horizon_color], dtype=np.float32)
+        # Negative values are clamped like glColor3f does
+        self.sky_colors[:] = np.clip(palette[self.sky_slots], 0.0, 1.0)
+        glBindBuffer(GL_ARRAY_BUFFER, self.sky_cbo)
+        glBufferSubData(GL_ARRAY_BUFFER, 0, self.sky_colors.nbytes, self.sky_colors)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.colors_dirty = False
+
     def draw(self):
-        # Draw sky gradient
-        glBegin(GL_QUADS)
-        
-        # Back wall (sky gradient)
-        # Top of sky
-        glColor3f(*self.sky_color)
-        glVertex3f(-20, 20, -20)
-        glVertex3f(20, 20, -20)
-        glVertex3f(20, 0, -20)
-        glVertex3f(-20, 0, -20)
-        
-        # Middle of sky (sunset colors)
-        glColor3f(*self.sunset_color)
-        glVertex3f(-20, 0, -20)
-        glVertex3f(20, 0, -20)
-        glVertex3f(20, -2, -20)
-        glVertex3f(-20, -2, -20)
-        
-        # Left wall
-        glColor3f(*self.sky_color)
-        glVertex3f(-20, 20, -20)
-        glVertex3f(-20, 20, 20)
-        glVertex3f(-20, 0, 20)
-        glVertex3f(-20, 0, -20)
-        
-        glColor3f(*self.sunset_color)
-        glVertex3f(-20, 0, -20)
-        glVertex3f(-20, 0, 20)
-        glVertex3f(-20, -2, 20)
-        glVertex3f(-20, -2, -20)
-        
-        # Right wall
-        glColor3f(*self.sky_color)
-        glVertex3f(20, 20, -20)
-        glVertex3f(20, 20, 20)
-        glVertex3f(20, 0, 20)
-        glVertex3f(20, 0, -20)
-        
-        glColor3f(*self.sunset_color)
-        glVertex3f(20, 0, -20)
-        glVertex3f(20, 0, 20)
-        glVertex3f(20, -2, 20)
-        glVertex3f(20, -2, -20)
-        
-        # Top wall (ceiling)
-        glColor3f(*self.sky_color)
-        glVertex3f(-20, 20, -20)
-        glVertex3f(20, 20, -20)
-        glVertex3f(20, 20, 20)
-        glVertex3f(-20, 20, 20)
-        
-        # Bottom wall (floor sky reflection)
-        glColor3f(*self.horizon_color)
-        glVertex3f(-20, -2, -20)
-        glVertex3f(20, -2, -20)
-        glVertex3f(20, -2, 20)
-        glVertex3f(-20, -2, 20)
-        
-        glEnd()
-        
-        # Draw sun
-        glPushMatrix()
-        glTranslatef(self.sun_position[0], self.sun_position[1], self.sun_position[2])
-        
-        # Sun glow effect
+        if self.colors_dirty:
+            self._upload_colors()
+
+        # Draw sky gradient, the walls have no normals of their own
+        glUseProgram(self.program)
+        glVertexAttrib3f(2, *SKY_NORMAL)
+        glBindVertexArray(self.sky_vao)
+        glDrawElements(GL_TRIANGLES, len(self.sky_indices), GL_UNSIGNED_INT, None)
+
+        # Sun glow effect, all spheres in one draw
         glEnable(GL_BLEND)
         glBlendFunc(GL_SRC_ALPHA, GL_ONE)
-        
-        # Draw multiple spheres for glow effect
-        for i in range(3):
-            scale = 1.0 + i * 0.3
-            alpha = 0.3 - i * 0.1
-            glColor4f(self.sun_color[0], self.sun_color[1], self.sun_color[2], alpha)
-            quad = gluNewQuadric()
-            gluSphere(quad, self.sun_radius * scale, 32, 32)
-        
+        glBindVertexArray(self.glow_vao)
+        glDrawElements(GL_TRIANGLES, len(self.glow_indices), GL_UNSIGNED_INT, None)
+        glBindVertexArray(0)
+
         glDisable(GL_BLEND)
-        glPopMatrix() 
\ No newline at end of file
+        glUseProgram(0)
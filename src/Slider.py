@@ -2,6 +2,9 @@ import math
 import pygame
 from OpenGL.GL import *
 from src.consts import *
+from src.TextRenderer import draw_label, get_glyph_atlas
+
+VALUE_FONT_SIZE = 24
 
 """
 This is a class describing the slider.
@@ -26,34 +29,32 @@ class Slider:
         self.is_wind_slider = is_wind_slider
         self.is_sky_rgb = is_sky_rgb
         self.sand_storm = None  
+        self.value_text = None
+        self.value_quads = None
         
+    def state(self):
+        """Everything the look of the slider depends on, drawn again when it changes"""
+        return self.value, self.dragging
+
     def set_sand_storm(self, sand_storm):
         self.sand_storm = sand_storm
         
     def draw_value_text(self):
-        # Create font here instead of in __init__
-        font = pygame.font.Font(None, 24)
-        
         # Format the value based on slider type
         if self.is_wind_slider:
             value_text = f"{round(float(self.value),2)}°"
         else:
             value_text = f"{round(float(self.value),2)}"
-            
-        text_surface = font.render(value_text, True, (0, 0, 0))  # Changed to black color
-        text_data = pygame.image.tostring(text_surface, "RGBA", True)
-        width = text_surface.get_width()
-        height = text_surface.get_height()
-        
-        glEnable(GL_BLEND)
-        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-        
-        # Position the text to the right of the slider
-        glRasterPos2d(self.x + self.width + 10, self.y + (self.height - height) / 2)
-        glDrawPixels(width, height, GL_RGBA, GL_UNSIGNED_BYTE, text_data)
-        
-        glDisable(GL_BLEND)
-        
+
+        # Lay out the text again only when the value has changed
+        atlas = get_glyph_atlas(VALUE_FONT_SIZE)
+        if value_text != self.value_text:
+            self.value_text = value_text
+            # Position the text to the right of the slider
+            self.value_quads = atlas.layout(value_text, self.x + self.width + 10,
+                                            self.y + (self.height - atlas.height) / 2)
+        atlas.draw(*self.value_quads)
+
     def draw(self):
         # Draw slider track
         glBegin(GL_QUADS)
@@ -143,9 +144,8 @@ class Slider:
                 # Update particle count in SandStorm
                 new_count = int(self.value)
                 if len(self.sand_storm.particles) != new_count:
-                    self.sand_storm.particles = []
-                    for _ in range(new_count):
-                        self.sand_storm.add_particles(1, pygame.Vector3(0, 14, 0))
+                    self.sand_storm.particles.clear()
+                    self.sand_storm.add_particles(new_count, pygame.Vector3(0, 14, 0))
             elif self.is_color_slider and not self.is_sky_rgb:
                 # Update sky colors (only for the old color slider, not for RGB sliders)
                 global SKY_COLOR, SUNSET_COLOR, HORIZON_COLOR
@@ -183,16 +183,4 @@ class Slider:
                 SMALL_PARTICLE_MAX = self.value * 0.6
 
 def draw_text(text, x, y, font_size=36):
-    font = pygame.font.Font(None, font_size)
-    text_surface = font.render(text, True, (0, 0, 0))  # Changed to black color
-    text_data = pygame.image.tostring(text_surface, "RGBA", True)
-    width = text_surface.get_width()
-    height = text_surface.get_height()
-    
-    glEnable(GL_BLEND)
-    glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-    
-    glRasterPos2d(x, y)
-    glDrawPixels(width, height, GL_RGBA, GL_UNSIGNED_BYTE, text_data)
-    
-    glDisable(GL_BLEND) 
\ No newline at end of file
+    draw_label(text, x, y, font_size)
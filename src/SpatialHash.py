@@ -0,0 +1,230 @@
+import numpy as np
+
+"""
+This is a class describing the spatial hash grid of the particles.
+Space is divided into cubic cells with the size of the search radius.
+The grid is rebuilt every step by sorting the particles by their cell, so
+the particles of one cell are stored next to each other and a radius search
+only looks at the neighboring cells instead of at all particles. Building and searching stays close to linear in the
+number of particles.
+It is used to:
+- index the particle positions every step
+- find all pairs of particles closer than a radius
+- find the particles near a set of points
+- group nearby particles into clusters
+"""
+
+# Neighbor cells visited for pairs: the cell itself and half of the 26 neighbors,
+# the other half is covered when the neighbor cell does the search
+HALF_NEIGHBORHOOD = np.array([(0, 0, 0)] + [
+    (dx, dy, dz)
+    for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)
+    if (dx, dy, dz) > (0, 0, 0)
+], dtype=np.int64)
+FULL_NEIGHBORHOOD = np.array([
+    (dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)
+], dtype=np.int64)
+
+# Up to this many grid cells per particle, occupied cells are found with a lookup
+# table over the whole bounding box, for sparser grids with a binary search
+DENSE_CELLS_PER_PARTICLE = 32
+
+
+class SpatialHash:
+    def __init__(self, cell_size: float):
+        """
+        Args:
+            cell_size: Size of the grid cells, it must not be smaller than the search radius
+        """
+        self.cell_size = cell_size
+        self.clear()
+
+    def clear(self):
+        """Remove all positions from the index"""
+        self.count = 0
+        self.order = np.zeros(0, dtype=np.int64)
+        self.sorted_positions = np.zeros((3, 0))
+        self.low = np.zeros(3, dtype=np.int64)
+        self.dims = np.ones(3, dtype=np.int64)
+        self.strides = np.array([1, 1, 1], dtype=np.int64)
+        # Key, first particle and number of particles of every occupied cell
+        self.cell_keys = np.zeros(0, dtype=np.int64)
+        self.cell_start = np.zeros(0, dtype=np.int64)
+        self.cell_count = np.zeros(0, dtype=np.int64)
+        # Index of the occupied cell for every key of the bounding box, -1 for empty cells
+        self.cell_lookup = None
+
+    def _cells(self, positions: np.ndarray):
+        return np.floor(positions / self.cell_size).astype(np.int64)
+
+    def build(self, positions: np.ndarray):
+        """
+        Index the positions, replacing the previous ones
+        Args:
+            positions: Array of shape (N, 3)
+        """
+        count = len(positions)
+        if count == 0:
+            self.clear()
+            return
+        self.count = count
+
+        # Cells are numbered inside the bounding box of the particles, with a border
+        # of one empty cell, so the key of a neighbor cell is the key plus a constant
+        cells = self._cells(positions)
+        self.low = cells.min(axis=0) - 1
+        self.dims = cells.max(axis=0) - self.low + 2
+        self.strides = np.array([self.dims[1] * self.dims[2], self.dims[2], 1], dtype=np.int64)
+        cells -= self.low
+        keys = cells @ self.strides
+
+        # Particles sorted by their cell, the particles of one cell form a contiguous run.
+        # Searches work on the sorted copy, so neighbors are close in memory.
+        self.order = np.argsort(keys, kind="stable")
+        # One contiguous row per axis, gathering from rows is much faster than from (N, 3)
+        self.sorted_positions = np.take(positions, self.order, axis=0).T.copy()
+        self.cell_keys, self.cell_start, self.cell_count = np.unique(
+            keys[self.order], return_index=True, return_counts=True)
+        cell_total = int(np.prod(self.dims))
+        if cell_total <= DENSE_CELLS_PER_PARTICLE * count:
+            self.cell_lookup = np.full(cell_total, -1, dtype=np.int64)
+            self.cell_lookup[self.cell_keys] = np.arange(len(self.cell_keys))
+        else:
+            self.cell_lookup = None
+
+    def _distance_squared(self, first: np.ndarray, second: np.ndarray):
+        """Squared distances between particles given by their positions in the sorted order"""
+        distance = np.zeros(len(first))
+        for row in self.sorted_positions:
+            delta = np.take(row, first)
+            delta -= np.take(row, second)
+            delta *= delta
+            distance += delta
+        return distance
+
+    def _find_cells(self, keys: np.ndarray):
+        """
+        Returns:
+            Index of every key in the occupied cells, -1 for empty cells
+        """
+        if self.cell_lookup is not None:
+            return np.take(self.cell_lookup, keys)
+        index = np.searchsorted(self.cell_keys, keys)
+        np.minimum(index, len(self.cell_keys) - 1, out=index)
+        index[self.cell_keys[index] != keys] = -1
+        return index
+
+    def _expand(self, first_cells: np.ndarray, second_cells: np.ndarray):
+        """
+        Every combination of a particle of the first cell with a particle of the second cell
+        Returns:
+            (first, second) positions of the particles in the sorted order
+        """
+        first_count = self.cell_count[first_cells]
+        second_count = self.cell_count[second_cells]
+        combinations = first_count * second_count
+        total = int(combinations.sum())
+        pair = np.repeat(np.arange(len(first_cells)), combinations)
+        # Number of the combination inside its pair of cells
+        local = np.arange(total) - np.repeat(np.cumsum(combinations) - combinations, combinations)
+        columns = second_count[pair]
+        first = self.cell_start[first_cells][pair] + local // columns
+        second = self.cell_start[second_cells][pair] + local % columns
+        return first, second
+
+    def pairs(self, radius: float):
+        """
+        Find all pairs of indexed particles closer than radius
+        Args:
+            radius: Search radius, at most cell_size
+        Returns:
+            (first, second) index arrays with first < second, every pair once
+        """
+        # Pairs of occupied neighbor cells
+        first_cells = []
+        second_cells = []
+        occupied = np.arange(len(self.cell_keys))
+        for offset in HALF_NEIGHBORHOOD:
+            neighbor = self._find_cells(self.cell_keys + offset @ self.strides)
+            found = neighbor >= 0
+            first_cells.append(occupied[found])
+            second_cells.append(neighbor[found])
+        first, second = self._expand(np.concatenate(first_cells), np.concatenate(second_cells))
+
+        # The cell itself comes first in HALF_NEIGHBORHOOD. Pairs inside one cell
+        # are found from both particles (and with themselves), keep one of them.
+        same_cell = int(self.cell_count @ self.cell_count)
+        keep = np.ones(len(first), dtype=bool)
+        np.less(first[:same_cell], second[:same_cell], out=keep[:same_cell])
+        first, second = first[keep], second[keep]
+
+        close = self._distance_squared(first, second) < radius * radius
+
+        # Back to the indices of the positions passed to build
+        first = self.order[first[close]]
+        second = self.order[second[close]]
+        return np.minimum(first, second), np.maximum(first, second)
+
+    def query(self, points: np.ndarray, radius: float):
+        """
+        Find the indexed particles closer than radius to every point
+        Args:
+            points: Array of shape (M, 3)
+            radius: Search radius, at most cell_size
+        Returns:
+            (point, particle) index arrays, one entry per particle near a point
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        point_parts = [np.zeros(0, dtype=np.int64)]
+        particle_parts = [np.zeros(0, dtype=np.int64)]
+        if self.count == 0:
+            return point_parts[0], particle_parts[0]
+
+        cells = self._cells(points) - self.low
+        for offset in FULL_NEIGHBORHOOD:
+            neighbor = cells + offset
+            # Cells outside the bounding box hold no particles
+            inside = ((neighbor >= 0) & (neighbor < self.dims)).all(axis=1)
+            found = np.full(len(points), -1)
+            found[inside] = self._find_cells(neighbor[inside] @ self.strides)
+            point = np.flatnonzero(found >= 0)
+            counts = self.cell_count[found[point]]
+            local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            particle = np.repeat(self.cell_start[found[point]], counts) + local
+            point = np.repeat(point, counts)
+
+            delta = np.take(points, point, axis=0) - np.take(self.sorted_positions, particle, axis=1).T
+            close = np.einsum("ij,ij->i", delta, delta) < radius * radius
+            point_parts.append(point[close])
+            particle_parts.append(particle[close])
+        return np.concatenate(point_parts), self.order[np.concatenate(particle_parts)]
+
+
+def find_clusters(first: np.ndarray, second: np.ndarray, count: int):
+    """
+    Group particles connected by pairs into clusters
+    Args:
+        first, second: Index arrays of connected pairs
+        count: Number of particles
+    Returns:
+        Array of count cluster labels, the label of a cluster is its smallest particle index
+    """
+    labels = np.arange(count)
+    while len(first) > 0:
+        # Labels are always roots here. For pairs in different clusters the root
+        # with the larger label is hooked below the smaller one.
+        first_root = labels[first]
+        second_root = labels[second]
+        apart = first_root != second_root
+        first, second = first[apart], second[apart]
+        low = np.minimum(first_root[apart], second_root[apart])
+        high = np.maximum(first_root[apart], second_root[apart])
+        np.minimum.at(labels, high, low)
+
+        # Jump until every particle points directly at its root
+        while True:
+            roots = labels[labels]
+            if (roots == labels).all():
+                break
+            labels = roots
+    return labels
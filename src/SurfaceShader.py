@@ -0,0 +1,50 @@
+from src.Shaders import get_program
+from src.SceneUniforms import SCENE_BLOCK, SCENE_BINDING
+from src.Lighting import LIGHTING
+
+"""
+This file contains the shader of the terrain and ground surfaces.
+Both have positions in attribute 0 and colors in attribute 1 and no
+normals; the normal of every triangle comes from the screen-space
+derivatives of its eye-space position, so the surfaces are lit without
+a normal buffer.
+It is used to:
+- transform the surfaces with the camera of the scene uniform buffer
+- light them with the light of the scene
+"""
+
+SURFACE_VERTEX_SHADER = """
+#version 330
+""" + SCENE_BLOCK + """
+in vec3 vertex;
+in vec4 color;
+out vec4 surface_color;
+out vec3 eye_position;
+
+void main() {
+    vec4 eye = view * vec4(vertex, 1.0);
+    gl_Position = projection * eye;
+    eye_position = eye.xyz;
+    surface_color = color;
+}
+"""
+
+SURFACE_FRAGMENT_SHADER = """
+#version 330
+""" + SCENE_BLOCK + LIGHTING + """
+in vec4 surface_color;
+in vec3 eye_position;
+out vec4 fragment_color;
+
+void main() {
+    // Flat normal of the triangle, it always faces the camera
+    vec3 normal = normalize(cross(dFdx(eye_position), dFdy(eye_position)));
+    fragment_color = vec4(light_color(surface_color.rgb, normal, eye_position), surface_color.a);
+}
+"""
+
+
+def get_surface_program():
+    """Returns the shared surface program, compiled on the first call"""
+    return get_program(SURFACE_VERTEX_SHADER, SURFACE_FRAGMENT_SHADER,
+                       attributes=("vertex", "color"), uniform_blocks={"Scene": SCENE_BINDING})
@@ -0,0 +1,178 @@
+import numpy as np
+import pygame
+from OpenGL.GL import *
+
+"""
+This file contains the cached text rendering used by the control panel.
+Fonts, glyph atlases and label textures are created once and reused,
+so drawing text does not render or upload anything on a normal frame.
+It is used to:
+- keep one pygame font per font size
+- keep one glyph atlas texture per font size for text that changes (slider values)
+- keep one texture per static label
+- draw text as textured quads
+"""
+
+# Characters available in the glyph atlas
+ATLAS_CHARACTERS = "".join(chr(code) for code in range(32, 127)) + "°"
+ATLAS_MAX_WIDTH = 1024
+TEXT_COLOR = (0, 0, 0)
+
+_fonts = {}
+_atlases = {}
+_labels = {}
+
+
+def get_font(font_size: int):
+    """Returns the cached font for the given size"""
+    font = _fonts.get(font_size)
+    if font is None:
+        font = pygame.font.Font(None, font_size)
+        _fonts[font_size] = font
+    return font
+
+
+def create_texture(surface: pygame.Surface):
+    """
+    Upload a pygame surface as an RGBA texture
+    Args:
+        surface: Surface to upload, its first row becomes the top of the texture
+    """
+    data = pygame.image.tostring(surface, "RGBA", False)
+    texture = glGenTextures(1)
+    glBindTexture(GL_TEXTURE_2D, texture)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+    glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, surface.get_width(), surface.get_height(), 0,
+                 GL_RGBA, GL_UNSIGNED_BYTE, data)
+    glBindTexture(GL_TEXTURE_2D, 0)
+    return texture
+
+
+def draw_quads(texture, vertices: np.ndarray, tex_coords: np.ndarray):
+    """
+    Draw textured quads with alpha blending
+    Args:
+        texture: Texture to sample
+        vertices: Array of shape (4 * N, 2) with screen positions
+        tex_coords: Array of shape (4 * N, 2) with texture coordinates
+    """
+    if len(vertices) == 0:
+        return
+    glEnable(GL_TEXTURE_2D)
+    glEnable(GL_BLEND)
+    glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+    glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_REPLACE)
+    glBindTexture(GL_TEXTURE_2D, texture)
+
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+    glVertexPointer(2, GL_FLOAT, 0, vertices)
+    glTexCoordPointer(2, GL_FLOAT, 0, tex_coords)
+    glDrawArrays(GL_QUADS, 0, len(vertices))
+    glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+    glDisableClientState(GL_VERTEX_ARRAY)
+
+    glBindTexture(GL_TEXTURE_2D, 0)
+    glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_MODULATE)
+    glDisable(GL_BLEND)
+    glDisable(GL_TEXTURE_2D)
+
+
+def quad(x0, y0, x1, y1):
+    """Corners of an axis-aligned quad, in the order used by GL_QUADS"""
+    return [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+
+
+"""
+This is a class describing a glyph atlas.
+All characters of one font size are rendered once into a single texture,
+and any string is drawn as one quad per character.
+"""
+class GlyphAtlas:
+    def __init__(self, font_size: int):
+        font = get_font(font_size)
+        self.height = font.get_height()
+        glyphs = [font.render(character, True, TEXT_COLOR) for character in ATLAS_CHARACTERS]
+
+        # Pack the glyphs into rows no wider than ATLAS_MAX_WIDTH
+        positions = []
+        x = y = 0
+        for glyph in glyphs:
+            if x + glyph.get_width() > ATLAS_MAX_WIDTH:
+                x = 0
+                y += self.height
+            positions.append((x, y))
+            x += glyph.get_width()
+        atlas_width = ATLAS_MAX_WIDTH if y > 0 else max(x, 1)
+        atlas_height = y + self.height
+
+        surface = pygame.Surface((atlas_width, atlas_height), pygame.SRCALPHA)
+        # Character -> (advance, u0, v0, u1, v1)
+        self.glyphs = {}
+        for character, glyph, (gx, gy) in zip(ATLAS_CHARACTERS, glyphs, positions):
+            surface.blit(glyph, (gx, gy))
+            self.glyphs[character] = (
+                glyph.get_width(),
+                gx / atlas_width, gy / atlas_height,
+                (gx + glyph.get_width()) / atlas_width, (gy + glyph.get_height()) / atlas_height,
+            )
+        self.texture = create_texture(surface)
+
+    def layout(self, text: str, x: float, y: float):
+        """
+        Build the quads of a string, the bottom-left corner of the text is at (x, y)
+        Returns:
+            (vertices, tex_coords) arrays to pass to draw
+        """
+        vertices = []
+        tex_coords = []
+        for character in text:
+            glyph = self.glyphs.get(character, self.glyphs["?"])
+            advance, u0, v0, u1, v1 = glyph
+            vertices.extend(quad(x, y - self.height, x + advance, y))
+            tex_coords.extend(quad(u0, v0, u1, v1))
+            x += advance
+        return (np.array(vertices, dtype=np.float32).reshape(-1, 2),
+                np.array(tex_coords, dtype=np.float32).reshape(-1, 2))
+
+    def draw(self, vertices: np.ndarray, tex_coords: np.ndarray):
+        draw_quads(self.texture, vertices, tex_coords)
+
+
+def get_glyph_atlas(font_size: int):
+    """Returns the cached glyph atlas for the given font size"""
+    atlas = _atlases.get(font_size)
+    if atlas is None:
+        atlas = GlyphAtlas(font_size)
+        _atlases[font_size] = atlas
+    return atlas
+
+
+def draw_label(text: str, x: float, y: float, font_size: int):
+    """
+    Draw a static label, its texture is created on first use and reused afterwards
+    Args:
+        text: Text of the label
+        x, y: Bottom-left corner of the text
+        font_size: Size of the font
+    """
+    key = (text, font_size)
+    label = _labels.get(key)
+    if label is None:
+        surface = get_font(font_size).render(text, True, TEXT_COLOR)
+        width, height = surface.get_size()
+        label = (
+            create_texture(surface),
+            np.array(quad(0, -height, width, 0), dtype=np.float32),
+            np.array(quad(0, 0, 1, 1), dtype=np.float32),
+        )
+        _labels[key] = label
+    texture, vertices, tex_coords = label
+    glPushMatrix()
+    glTranslatef(x, y, 0)
+    draw_quads(texture, vertices, tex_coords)
+    glPopMatrix()
@@ -0,0 +1,77 @@
+import numpy as np
+
+"""
+This is a class describing the tiles of a grid mesh.
+The cells of a square grid of vertices (terrain, ground) are grouped into
+square tiles. The triangles are reordered tile by tile, so every tile is
+one contiguous range of the index buffer, and every tile keeps the bounding
+box of its vertices for culling.
+It is used to:
+- split the triangles of a grid into tiles
+- keep the bounding box of every tile
+- find the tiles inside the view frustum
+- turn the visible tiles into as few index ranges as possible
+"""
+class TileGrid:
+    def __init__(self, vertices: np.ndarray, resolution: int, tile_cells: int):
+        """
+        Args:
+            vertices: Flat array of vertex positions, vertex (i, j) at index i * resolution + j
+            resolution: Number of vertices along each side of the grid
+            tile_cells: Number of grid cells along each side of a tile
+        """
+        vertices = np.asarray(vertices).reshape(resolution, resolution, 3)
+        cells = resolution - 1
+        tiles = -(-cells // tile_cells)
+        self.shape = (tiles, tiles)
+
+        # Two triangles for every cell, the same as in HeightMap and Ground
+        ci, cj = np.meshgrid(np.arange(cells), np.arange(cells), indexing="ij")
+        v0 = (ci * resolution + cj).ravel()
+        v1 = v0 + 1
+        v2 = v0 + resolution
+        v3 = v2 + 1
+        cell_indices = np.stack((v0, v1, v2, v1, v3, v2), axis=-1)
+
+        # Cells ordered by their tile, rows of tiles first
+        tile = ((ci // tile_cells) * tiles + cj // tile_cells).ravel()
+        order = np.argsort(tile, kind="stable")
+        self.indices = cell_indices[order].astype(np.uint32).ravel()
+        cell_counts = np.bincount(tile, minlength=tiles * tiles)
+        # Index range of every tile
+        self.counts = cell_counts * 6
+        self.firsts = np.cumsum(self.counts) - self.counts
+
+        # Bounding box of every cell, then of every tile
+        corners = np.stack((vertices[:-1, :-1], vertices[1:, :-1], vertices[:-1, 1:], vertices[1:, 1:]))
+        cell_lows = corners.min(axis=0).reshape(-1, 3)[order]
+        cell_highs = corners.max(axis=0).reshape(-1, 3)[order]
+        starts = np.cumsum(cell_counts) - cell_counts
+        self.lows = np.minimum.reduceat(cell_lows, starts, axis=0)
+        self.highs = np.maximum.reduceat(cell_highs, starts, axis=0)
+
+    def ranges(self, visible: np.ndarray = None):
+        """
+        Index ranges covering the visible tiles, neighbouring tiles are merged into one range
+        Args:
+            visible: Boolean array with one value per tile, None for all tiles
+        Returns:
+            (firsts, counts) arrays, in indices
+        """
+        if visible is None:
+            return self.firsts[:1], np.array([len(self.indices)])
+        # A range starts at a visible tile after a hidden one and ends before the next hidden one
+        edges = np.diff(np.concatenate(([False], visible, [False])).astype(np.int8))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        firsts = self.firsts[starts]
+        counts = self.firsts[ends - 1] + self.counts[ends - 1] - firsts
+        return firsts, counts
+
+    def visible_ranges(self, frustum=None):
+        """
+        Index ranges of the tiles inside the frustum, all tiles without a frustum
+        """
+        if frustum is None:
+            return self.ranges()
+        return self.ranges(frustum.boxes_visible(self.lows, self.highs))
@@ -0,0 +1,156 @@
+import numpy as np
+from src.consts import (WIND_FIELD_CELL_SIZE, WIND_FIELD_UPDATE_INTERVAL, WIND_NOISE_SCALE,
+                        WIND_NOISE_SPEED, WIND_GUST_STRENGTH)
+from src.Noise import SimplexNoise
+
+"""
+This is a class describing the wind field of the storm.
+The wind is kept on a coarse 3D grid over the terrain domain: the wind of
+the sliders plus gusts from curl noise. The curl of a noise field has no
+sources or sinks, so the gusts form coherent swirls instead of random
+jitter. The noise is evaluated only a few times per second; in between the
+grid is blended from the last noise key frame to the next one, and the
+particles sample it with trilinear interpolation.
+It is used to:
+- build the gusts from time-evolving curl noise
+- update the wind grid from the wind direction, strength and turbulence
+- sample the wind at arrays of positions
+"""
+
+
+def sample_wind(field, positions: np.ndarray, out: np.ndarray):
+    """
+    Trilinear lookup of the wind, positions outside the grid use the nearest edge
+    Args:
+        field: (grid, low, cell_size) with grid of shape (3, X, Y, Z), one block per
+            wind component, and low the position of node (0, 0, 0)
+        positions: Array of shape (N, 3)
+        out: Array of shape (N, 3) for the wind
+    Returns:
+        out
+    """
+    grid, low, cell_size = field
+    shape = grid.shape[1:]
+    strides = (shape[1] * shape[2], shape[2], 1)
+
+    # Flat index of the base node of every position and the fractions along each axis.
+    # Every axis is handled as its own contiguous array, which is much faster than (N, 3).
+    index = np.zeros(len(positions), dtype=np.int64)
+    fractions = []
+    for axis in range(3):
+        coordinate = positions[:, axis] - low[axis]
+        coordinate /= cell_size
+        np.clip(coordinate, 0, shape[axis] - 1, out=coordinate)
+        base = np.minimum(coordinate.astype(np.int64), shape[axis] - 2)
+        coordinate -= base
+        fractions.append(coordinate)
+        base *= strides[axis]
+        index += base
+    fx, fy, fz = fractions
+    flat = grid.reshape(3, -1)
+
+    def corner(dx, dy, dz):
+        return np.take(flat, index + (dx * strides[0] + dy * strides[1] + dz), axis=1)
+
+    def lerp(a, b, t):
+        # a + (b - a) * t, written into a
+        b -= a
+        b *= t
+        a += b
+        return a
+
+    # Interpolate along Z, then Y, then X
+    low_x = lerp(lerp(corner(0, 0, 0), corner(0, 0, 1), fz), lerp(corner(0, 1, 0), corner(0, 1, 1), fz), fy)
+    high_x = lerp(lerp(corner(1, 0, 0), corner(1, 0, 1), fz), lerp(corner(1, 1, 0), corner(1, 1, 1), fz), fy)
+    out.T[:] = lerp(low_x, high_x, fx)
+    return out
+
+
+class WindField:
+    def __init__(self, center, size: float, seed: int = 0, cell_size: float = WIND_FIELD_CELL_SIZE):
+        """
+        Args:
+            center: Center of the domain
+            size: Size of the cubic domain
+            seed: Seed of the noise
+            cell_size: Distance between grid nodes
+        """
+        nodes = int(np.ceil(size / cell_size)) + 1
+        self.shape = (nodes, nodes, nodes)
+        self.cell_size = cell_size
+        self.low = np.asarray(center, dtype=np.float64) - size / 2
+        axis = np.arange(nodes) * cell_size
+        self.nodes = np.stack(np.meshgrid(axis, axis, axis, indexing="ij"), axis=-1) + self.low
+        # One noise per component of the vector potential
+        self.noise = [SimplexNoise(seed + component) for component in range(3)]
+
+        # One block per wind component, see sample_wind. Single precision is enough
+        # for the wind and halves the data read per particle and sent to workers.
+        self.grid = np.zeros((3,) + self.shape, dtype=np.float32)
+        self.key_time = None
+        self.previous_gusts = None
+        self.next_gusts = None
+
+    def _potential(self, time: float):
+        """Vector potential at the grid nodes, every component mixes two noise planes"""
+        position = self.nodes * WIND_NOISE_SCALE
+        shift = time * WIND_NOISE_SPEED
+        potential = np.empty(self.shape + (3,))
+        for component, noise in enumerate(self.noise):
+            a = position[..., component]
+            b = position[..., (component + 1) % 3]
+            c = position[..., (component + 2) % 3]
+            potential[..., component] = noise.noise2(b, c + shift) + noise.noise2(a - shift, b + 50.0)
+        return potential
+
+    def _gusts(self, time: float):
+        """
+        Curl of the noise potential with shape (3, X, Y, Z), scaled to a typical length of about 1
+        """
+        potential = self._potential(time)
+        derivative = [np.gradient(potential[..., component], self.cell_size) for component in range(3)]
+        # derivative[i][j] is the derivative of component i along axis j
+        curl = np.stack((
+            derivative[2][1] - derivative[1][2],
+            derivative[0][2] - derivative[2][0],
+            derivative[1][0] - derivative[0][1],
+        ))
+        return curl / (2 * WIND_NOISE_SCALE)
+
+    def update(self, time: float, wind, turbulence: float):
+        """
+        Update the grid for the given simulated time
+        Args:
+            time: Simulated time in seconds
+            wind: Wind of the sliders (direction scaled by strength)
+            turbulence: Strength of the gusts relative to WIND_GUST_STRENGTH
+        """
+        # New noise key frame every WIND_FIELD_UPDATE_INTERVAL seconds
+        if self.key_time is None or time >= self.key_time + WIND_FIELD_UPDATE_INTERVAL:
+            key_time = time - time % WIND_FIELD_UPDATE_INTERVAL
+            if self.key_time is not None and np.isclose(key_time, self.key_time + WIND_FIELD_UPDATE_INTERVAL):
+                # The next key frame is already known
+                self.previous_gusts = self.next_gusts
+            else:
+                self.previous_gusts = self._gusts(key_time)
+            self.next_gusts = self._gusts(key_time + WIND_FIELD_UPDATE_INTERVAL)
+            self.key_time = key_time
+
+        blend = (time - self.key_time) / WIND_FIELD_UPDATE_INTERVAL
+        np.subtract(self.next_gusts, self.previous_gusts, out=self.grid)
+        self.grid *= blend
+        self.grid += self.previous_gusts
+        self.grid *= turbulence * WIND_GUST_STRENGTH
+        self.grid += np.asarray(wind, dtype=np.float64)[:, None, None, None]
+
+    def state(self):
+        """Grid data needed by sample_wind, also for worker processes"""
+        return self.grid, self.low, self.cell_size
+
+    def sample(self, positions: np.ndarray, out: np.ndarray = None):
+        """
+        Returns the wind at an array of positions of shape (N, 3)
+        """
+        if out is None:
+            out = np.empty((len(positions), 3))
+        return sample_wind(self.state(), positions, out)
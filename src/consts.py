@@ -44,6 +44,13 @@ COLOR_SLIDER_MAX = 1.0
 WIND_DIRECTION = [0.8, 0.0, 0.0]  
 WIND_STRENGTH = 2.5  
 
+# Wind field settings
+WIND_FIELD_CELL_SIZE = 2.5  # Distance between the nodes of the wind grid
+WIND_FIELD_UPDATE_INTERVAL = 0.25  # Seconds of simulated time between noise key frames
+WIND_NOISE_SCALE = 0.08  # Frequency of the gust noise, gusts are about 1 / scale wide
+WIND_NOISE_SPEED = 0.5  # How fast the gusts change over time
+WIND_GUST_STRENGTH = 25.0  # Speed of the gusts for a wind turbulence of 1
+
 # Wind direction slider settings
 WIND_SLIDER_X = 10
 WIND_SLIDER_Y = 250
@@ -53,12 +60,57 @@ WIND_SLIDER_MAX = 360
 # Particle settings
 PARTICLES_PER_CLUSTER = 5  # Number of particles in each cluster
 CLUSTER_RADIUS = 0.5  # Maximum distance between particles in a cluster
+COHESION_STRENGTH = 2.0  # Pull between particles of a cluster, 0 disables particle interaction
+COLLISION_STIFFNESS = 50.0  # Push between overlapping particles
+
+# Emission of sand from the terrain, weights of the vertex features in the emission distribution
+EMISSION_BASE_WEIGHT = 0.2  # Every vertex emits a little
+EMISSION_HEIGHT_WEIGHT = 1.0  # Higher vertices are more exposed, 0 at the lowest and 1 at the highest vertex
+EMISSION_EXPOSURE_WEIGHT = 2.0  # Slopes facing the wind emit more, by the horizontal part of their normal against the wind
+
+# Particle level of detail, by distance from the camera
+LOD_MESH_DISTANCE = 10.0  # Closer particles are drawn as sphere meshes
+LOD_BILLBOARD_DISTANCE = 25.0  # Closer particles are drawn as billboards, farther ones as point sprites
 
 # Terrain settings
 TERRAIN_SIZE = 40  
 TERRAIN_RESOLUTION = 30
 TERRAIN_HEIGHT = 2.0 
 TERRAIN_SCALE = 0.5  
+TERRAIN_SEED = 42
+TERRAIN_TILE_CELLS = 8  # Grid cells along each side of a ground tile, tiles outside the view are not drawn
+
+# Streamed terrain around the camera, in tiles of TERRAIN_SIZE
+TERRAIN_VIEW_TILES = 3  # Tiles drawn in every direction from the tile of the camera
+TERRAIN_LOD_CELLS = (30, 30, 15, 6)  # Grid cells along a tile, by tile distance from the camera (the last one beyond), divisors of TERRAIN_RESOLUTION
+TERRAIN_SKIRT_DEPTH = 1.0  # Depth of the walls along tile edges that hide cracks between different grids
+TERRAIN_WORKERS = 2  # Threads generating tiles
+TERRAIN_UPLOADS_PER_FRAME = 2  # Generated tiles uploaded to the GPU in one frame
+TERRAIN_MEMORY_BUDGET = 16 * 2 ** 20  # Bytes of tile buffers kept, the least recently drawn tiles are evicted above it
+
+# Seed of the random streams of the simulation, None gives a different storm on every run
+SIMULATION_SEED = None
+
+# Fixed-step simulation in main.py
+SIMULATION_STEP = 1 / 60  # Simulated seconds per step, independent of the frame rate
+MAX_CATCH_UP_STEPS = 4  # Most steps in one frame, the time beyond that is dropped after a stall
+
+# Particle-terrain collision settings
+GROUND_RESTITUTION = 0.3  # Part of the normal speed kept after a bounce
+GROUND_FRICTION = 0.2  # Part of the tangential speed lost on contact (slide)
+SETTLE_SPEED = 0.5  # Particles touching the ground slower than this come to rest
+
+# Frame profiler settings
+PROFILER_FRAMES = 600  # Number of frames kept for the timing statistics and traces
+PROFILER_OVERLAY_REFRESH = 30  # Frames between updates of the timing overlay
+
+# Adaptive quality settings, scales of the particle cap, the emission rate and the level of detail distances
+QUALITY_INTERVAL = 30  # Frames measured between two adjustments
+QUALITY_TOLERANCE = 0.1  # Frames slower than the target by this part lower the quality
+QUALITY_HEADROOM = 0.25  # Frames faster than the target by this part raise the quality
+QUALITY_MAX_CUT = 0.7  # Largest single reduction of a scale
+QUALITY_RECOVERY = 1.1  # Growth of a scale when there is headroom
+QUALITY_BOUNDS = {"particles": (0.1, 1.0), "emission": (0.25, 1.0), "lod": (0.2, 1.0)}
 
 
 window_dimensions = (0, 1400, 0, 800)